@@ -57,6 +57,10 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "api.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
 }
 
 
@@ -131,6 +135,16 @@ DATABASES = {
     }
 }
 
+# Cache wspólny dla wszystkich workerów gunicorna – wymagany CACHE_URL (brak -> ImproperlyConfigured przy starcie).
+# Znaczniki (Dictionary.content_stamp) i unieważnienia z sygnałów muszą być widoczne w każdym procesie
+# (LocMemCache jest per proces), a trafienie w cache nie może kosztować zapytania do bazy.
+# Domyślnie Redis: CACHE_URL=redis://redis:6379/1.
+# Tylko świadomie: CACHE_URL=dbcache://django_cache?max_entries=10000 (+ `manage.py createcachetable`) –
+# każde get/set to zapytanie do bazy, więc cache na gorących ścieżkach prawie nic nie daje.
+CACHES = {
+    'default': env.cache_url('CACHE_URL'),
+}
+
 
 
 # Password validation
@@ -0,0 +1,43 @@
+# api/renderers.py
+import orjson
+from django.http import HttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    JSON przez orjson (C) zamiast json.dumps.
+    Datetime/UUID/dataclass orjson koduje natywnie; pozostałe typy (Decimal, lazy str, QuerySet…)
+    obsługuje domyślny encoder DRF – wynik zgodny z JSONRenderer.
+    Wiersze NamedTuple z api.rows emitowane są jako obiekty.
+    """
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    _encoder_default = JSONEncoder().default
+
+    @classmethod
+    def _default(cls, obj):
+        # wiersze NamedTuple (api.rows) -> obiekt JSON, nie tablica
+        if isinstance(obj, tuple) and hasattr(obj, "_asdict"):
+            return obj._asdict()
+        return cls._encoder_default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        option = orjson.OPT_UTC_Z | orjson.OPT_NAIVE_UTC
+        if (renderer_context or {}).get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=self._default, option=option)
+
+
+def json_response(data, status: int = 200) -> HttpResponse:
+    """
+    Gotowa odpowiedź JSON z pominięciem Response DRF (negocjacja treści, wybór renderera, API przeglądarkowe).
+    Tylko dla zaufanych projekcji (values_list/wiersze api.rows) na gorących ścieżkach.
+    """
+    return HttpResponse(ORJSONRenderer().render(data), status=status, content_type=ORJSONRenderer.media_type)
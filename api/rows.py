@@ -0,0 +1,47 @@
+# api/rows.py
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from django.utils import timezone
+
+
+# Wiersze wynikowe o stałym kształcie dla zaufanych projekcji (values_list) – bez przejścia przez
+# serializer DRF pole po polu. Kolejność pól = kolejność kluczy w JSON (zgodna z serializerami);
+# ORJSONRenderer zamienia je na obiekty przez _asdict(). Daty w strefie lokalnej (TIME_ZONE) – jak
+# DateTimeField.to_representation w serializerach; wiersze budujemy przez from_row(), nie _make().
+
+
+def local_datetime(value: Optional[datetime]) -> Optional[datetime]:
+    # localtime(None) zwróciłoby "teraz" – NULL zostaje NULL-em
+    return timezone.localtime(value) if value is not None else None
+
+
+class PartnerRow(NamedTuple):
+    id: int
+    email: str
+    display_name: str
+    domain: str
+    msg_count: int
+    msg_processed_count: int
+    last_message_at: Optional[datetime]
+
+    @classmethod
+    def from_row(cls, row) -> "PartnerRow":
+        *head, last_message_at = row
+        return cls(*head, local_datetime(last_message_at))
+
+
+class ThreadRow(NamedTuple):
+    id: int
+    thread_key: str
+    subject_norm: str
+    created_at: datetime
+    matched_messages: int
+    last_activity: Optional[datetime]
+
+    @classmethod
+    def from_row(cls, row) -> "ThreadRow":
+        id, thread_key, subject_norm, created_at, matched_messages, last_activity = row
+        return cls(
+            id, thread_key, subject_norm, local_datetime(created_at), matched_messages, local_datetime(last_activity),
+        )
@@ -1,18 +1,51 @@
 # api/serializers.py
+import copy
+from dataclasses import dataclass
+
 from rest_framework import serializers
 
 from ingestion.models import Person, EmailMessage, Thread
 from dataset.models import Dictionary, DictionaryKind, DictionaryValue
 
 
+# ---- Wspólne ----
+
+class CachedFieldsMixin:
+    """
+    ModelSerializer.get_fields() przy każdej instancji introspekcjonuje model (build_field itd.).
+    Wynik jest stały dla klasy, więc budujemy go raz (per klasa) i zwracamy głęboką kopię –
+    tak jak DRF robi to z polami deklarowanymi.
+    """
+    def get_fields(self):
+        cls = type(self)
+        template = cls.__dict__.get("_fields_template")
+        if template is None:
+            template = super().get_fields()
+            cls._fields_template = template
+        return copy.deepcopy(template)
+
+
 # ---- Osoby / wątki / partnerzy ----
 
-class PersonSerializer(serializers.ModelSerializer):
+class PersonSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Person
         fields = ("id", "email", "display_name", "domain")
 
 
+class CachedPersonSerializer(PersonSerializer):
+    """
+    PersonSerializer z pamięcią podręczną w kontekście (per request, klucz: pk).
+    Ta sama osoba występująca w wielu wiadomościach listy jest serializowana raz.
+    """
+    def to_representation(self, instance):
+        cache = self.context.setdefault("_person_cache", {})
+        data = cache.get(instance.pk)
+        if data is None:
+            data = cache[instance.pk] = super().to_representation(instance)
+        return data
+
+
 class PartnerWithCountSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     email = serializers.EmailField()
@@ -39,49 +72,104 @@ class DictionarySerializer(serializers.ModelSerializer):
         fields = ("id", "code", "name", "description", "version", "locale", "is_active", "created_at", "updated_at")
 
 
+class DictionaryMiniSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Dictionary
+        fields = ("id", "code", "name", "version", "locale", "is_active")
+
+
 class DictionaryKindSerializer(serializers.ModelSerializer):
-    dictionary = serializers.SerializerMethodField()
+    # zagnieżdżony serializer czyta obiekt z select_related("dictionary") – bez zapytania per wiersz
+    dictionary = DictionaryMiniSerializer(read_only=True)
 
     class Meta:
         model = DictionaryKind
         fields = ("id", "code", "name", "description", "dictionary")
 
-    def get_dictionary(self, obj: DictionaryKind):
-        d = obj.dictionary
-        return {
-            "id": d.id,
-            "code": d.code,
-            "name": d.name,
-            "version": d.version,
-            "locale": d.locale,
-            "is_active": d.is_active,
-        }
 
+class DictionaryKindMiniSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DictionaryKind
+        fields = ("id", "code", "name")
 
-class DictionaryValueSerializer(serializers.ModelSerializer):
-    kind = serializers.SerializerMethodField()
-    dictionary = serializers.SerializerMethodField()
 
+class DictionaryRefSerializer(serializers.ModelSerializer):
     class Meta:
-        model = DictionaryValue
-        fields = ("id", "code", "name", "description", "sort_order", "is_active", "kind", "dictionary")
+        model = Dictionary
+        fields = ("id", "code", "version", "locale")
 
-    def get_kind(self, obj: DictionaryValue):
-        k = obj.kind
-        return {"id": k.id, "code": k.code, "name": k.name}
 
-    def get_dictionary(self, obj: DictionaryValue):
-        d = obj.kind.dictionary
-        return {"id": d.id, "code": d.code, "version": d.version, "locale": d.locale}
+class DictionaryValueSerializer(serializers.ModelSerializer):
+    # wymaga select_related("kind", "kind__dictionary") na querysecie
+    kind = DictionaryKindMiniSerializer(read_only=True)
+    dictionary = DictionaryRefSerializer(source="kind.dictionary", read_only=True)
+    label_count = serializers.IntegerField(read_only=True)  # adnotacja z DictionaryValueViewSet.get_queryset
+
+    class Meta:
+        model = DictionaryValue
+        fields = ("id", "code", "name", "description", "sort_order", "is_active", "kind", "dictionary", "label_count")
 
 
 # ---- OpenAI: preview (dynamiczne) ----
 
-class LabelPreviewInputSerializer(serializers.Serializer):
-    message_id = serializers.IntegerField(required=True)
-    # opcjonalne override'y (jeśli chcesz ich używać po stronie klienta LLM):
-    model = serializers.CharField(required=False, allow_blank=True)
-    temperature = serializers.FloatField(required=False)
+@dataclass(slots=True, frozen=True)
+class LabelPreviewInput:
+    """
+    Wejście POST /api/label/preview/{message,thread} – kształt znany z góry, więc walidujemy ręcznie
+    (bez run_validation DRF z walidatorami pole po polu). Błąd -> ValueError z komunikatem dla 400.
+    target_id = message_id albo thread_id (zależnie od widoku);
+    target_ids = lista z pola wsadowego (np. message_ids) – wtedy target_id jest None.
+    """
+    MAX_BATCH = 64
+
+    target_id: int | None
+    target_ids: tuple = ()
+    kinds: tuple = ()
+    dictionary_code: str = ""
+    dictionary_version: str = ""
+    dictionary_locale: str = ""
+
+    @staticmethod
+    def _to_id(raw, field: str) -> int:
+        if isinstance(raw, bool):
+            raise ValueError(f"Nieprawidłowe {field}.")
+        try:
+            return int(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f"Nieprawidłowe {field}.")
+
+    @classmethod
+    def from_data(cls, data, id_field: str, batch_field: str | None = None) -> "LabelPreviewInput":
+        target_id = None
+        target_ids = ()
+        raw_ids = data.get(batch_field) if batch_field else None
+        if raw_ids:
+            if not isinstance(raw_ids, (list, tuple)):
+                raise ValueError(f"Pole {batch_field} musi być listą.")
+            if len(raw_ids) > cls.MAX_BATCH:
+                raise ValueError(f"Pole {batch_field} może zawierać maks. {cls.MAX_BATCH} elementów.")
+            # bez duplikatów, z zachowaniem kolejności
+            target_ids = tuple(dict.fromkeys(cls._to_id(x, batch_field) for x in raw_ids))
+        else:
+            raw_id = data.get(id_field)
+            if not raw_id:
+                raise ValueError(f"Brak {id_field}.")
+            target_id = cls._to_id(raw_id, id_field)
+
+        kinds = data.get("kinds") or ()
+        if isinstance(kinds, (str, int)):
+            kinds = (kinds,)
+        elif not isinstance(kinds, (list, tuple)):
+            raise ValueError("Pole kinds musi być listą.")
+
+        return cls(
+            target_id=target_id,
+            target_ids=target_ids,
+            kinds=tuple(kinds),
+            dictionary_code=data.get("dictionary_code") or "",
+            dictionary_version=data.get("dictionary_version") or "",
+            dictionary_locale=data.get("dictionary_locale") or "",
+        )
 
 
 class LabelPreviewLabelSerializer(serializers.Serializer):
@@ -99,10 +187,10 @@ class LabelPreviewOutputSerializer(serializers.Serializer):
 
 # ---- Wiadomości e-mail ----
 
-class EmailMessageSerializer(serializers.ModelSerializer):
-    from_person = PersonSerializer(read_only=True)
-    delivered_to = PersonSerializer(read_only=True)
-    recipients = PersonSerializer(read_only=True, many=True)
+class EmailMessageSerializer(CachedFieldsMixin, serializers.ModelSerializer):
+    from_person = CachedPersonSerializer(read_only=True)
+    delivered_to = CachedPersonSerializer(read_only=True)
+    recipients = serializers.SerializerMethodField()
 
     class Meta:
         model = EmailMessage
@@ -121,3 +209,34 @@ class EmailMessageSerializer(serializers.ModelSerializer):
             "text_html_parsed",
             "text_plain"
         )
+
+    def get_recipients(self, obj):
+        # Adresaci z prefetchu (Person.only(...)) -> słowniki w jednym wyrażeniu, bez ListSerializer
+        # i to_representation per adresat; ten sam cache osób co CachedPersonSerializer.
+        cache = self.context.setdefault("_person_cache", {})
+        return [
+            cache.get(p.pk) or cache.setdefault(p.pk, {
+                "id": p.pk,
+                "email": p.email,
+                "display_name": p.display_name,
+                "domain": p.domain,
+            })
+            for p in obj.recipients.all()
+        ]
+
+
+class EmailMessageListSerializer(EmailMessageSerializer):
+    """Wariant listowy – same metadane, bez treści (text_processed/text_html_parsed/text_plain)."""
+    class Meta(EmailMessageSerializer.Meta):
+        fields = (
+            "id",
+            "subject",
+            "direction",
+            "sent_at",
+            "received_at",
+            "from_person",
+            "delivered_to",
+            "recipients",
+            "thread_id",
+            "useless",
+        )
@@ -23,12 +23,15 @@ router.register(r"dict-values", DictionaryValueViewSet, basename="dict-values")
 router.register(r"labels", LabelViewSet, basename="labels")
 router.register(r"threads", ThreadViewSet, basename="threads")
 
+# router.urls to property – materializujemy raz przy imporcie i wpinamy bezpośrednio w urlpatterns
+ROUTER_URLS = tuple(router.urls)
 
 urlpatterns = [
     path("token-auth/", TokenAuthView.as_view(), name="token-auth"),  # <-- /api/token-auth/
-    path("", include(router.urls)),                                   # Pozostałe endpointy
-    path("api-auth/", include("rest_framework.urls")),                # sesyjne logowanie /api-auth/login/
+    # stałe ścieżki przed routerem – resolver trafia w nie bez przechodzenia przez wzorce routera
     path("label/preview/message", LabelPreviewMessageView.as_view(), name="label-preview-message"),
     path("label/preview/thread", LabelPreviewThreadView.as_view(), name="label-preview-thread"),
     path("label/latest", LatestModelPredictView.as_view(), name="label-latest"),
+    *ROUTER_URLS,                                                     # Pozostałe endpointy (bez zagnieżdżonego include)
+    path("api-auth/", include("rest_framework.urls")),                # sesyjne logowanie /api-auth/login/
 ]
@@ -1,25 +1,32 @@
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
 from typing import Optional
-import re 
-import hashlib
 
 from django.conf import settings
 from django.db.models import (
-    Sum, F, Q, Value, IntegerField, OuterRef, Subquery, Max, Case, When, Count
+    Sum, F, Q, Value, IntegerField, DateTimeField, OuterRef, Subquery, Exists, Max, Case, When, Count, Prefetch, Func
 )
-from django.db import transaction
+from django.db import connections, transaction
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.db.models.functions import Coalesce
-from django.db.models import QuerySet
 
 from rest_framework import viewsets, mixins, status, permissions
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from rest_framework.views import APIView
 
 from ingestion.models import EmailMessage, PartnerStat, Person, MessageRecipient, Thread
+from ingestion.signals import recompute_partner_stats_for_message
 
 # Używamy *dynamicznych* helperów z chatgpt_client:
 from dataset.chatgpt_client import (
@@ -29,7 +36,10 @@ from dataset.chatgpt_client import (
 
 from dataset.models import Dictionary, DictionaryKind, DictionaryValue, DatasetSample, \
     Annotation, LabelFinal, ModelPrediction, _normalize_content, _sha256
-from .serializers import PersonSerializer, EmailMessageSerializer, ThreadSerializer
+from .serializers import PersonSerializer, EmailMessageSerializer, EmailMessageListSerializer, ThreadSerializer, \
+    DictionarySerializer, DictionaryKindSerializer, DictionaryValueSerializer, LabelPreviewInput
+from .rows import PartnerRow, ThreadRow, local_datetime
+from .renderers import json_response
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -39,6 +49,11 @@ OPENAI_MODEL_VERSION = settings.OPENAI_MODEL_VERSION
 DEFAULT_PREPROCESS_VERSION = settings.DEFAULT_PREPROCESS_VERSION
 OPENAI_API_KEY = settings.OPENAI_API_KEY
 
+# listy bez paginacji (all=true) i projekcje: iterator() zamiast cache'owania całego wyniku w QuerySet
+ITERATOR_CHUNK_SIZE = 2000
+# ThreadViewSet: do tylu id wiadomości pary materializujemy listę (literal IN (...)); powyżej – podzapytanie
+MATERIALIZED_IDS_MAX = 1000
+
 MAX_CHARS_THREAD = int(settings.MAX_CHARS_THREAD)
 THREAD_MSG_SEPARATOR = "\n\n---\n\n"
 
@@ -46,6 +61,9 @@ DICTIONARY_NAME_SET = settings.DICTIONARY_NAME_SET
 DICTIONARY_CODE_SET = settings.DICTIONARY_CODE_SET
 DEFAULT_PREPROCESS_LOCALE = settings.DEFAULT_PREPROCESS_LOCALE
 
+# czy ModelPrediction ma FK do słownika – sprawdzane raz przy imporcie
+_HAS_DICT_FK = hasattr(ModelPrediction, "dictionary_id")
+
 # --------------- Auth -------------------------------------------------------
 
 class TokenAuthView(ObtainAuthToken):
@@ -68,6 +86,16 @@ class SmallPage(PageNumberPagination):
     page_size_query_param = "page_size"
     max_page_size = 200
 
+class MessageCursorPage(CursorPagination):
+    """
+    Paginacja kursorowa (keyset) – koszt strony stały niezależnie od głębokości (brak OFFSET).
+    Sortujemy po PK: sent_at/received_at bywają NULL, a keyset po kolumnie z NULL-ami gubi wiersze.
+    """
+    page_size = 25
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = "id"
+
 class DynamicMaxPage(PageNumberPagination):
     page_size = 25
     page_size_query_param = "page_size"
@@ -84,48 +112,54 @@ class PersonViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = PersonSerializer
     pagination_class = DynamicMaxPage
 
-    def get_queryset(self):
-        # --- Subquery: sumy z PartnerStat, gdy osoba jest po stronie 'a' lub 'b' ---
-        sum_as_a = PartnerStat.objects.filter(a=OuterRef("pk")) \
-            .values("a") \
-            .annotate(s=Sum("msg_count")) \
-            .values("s")[:1]
-
-        sum_as_b = PartnerStat.objects.filter(b=OuterRef("pk")) \
-            .values("b") \
-            .annotate(s=Sum("msg_count")) \
-            .values("s")[:1]
-
-        sum_proc_as_a = PartnerStat.objects.filter(a=OuterRef("pk")) \
-            .values("a") \
-            .annotate(s=Sum("msg_processed_count")) \
-            .values("s")[:1]
-
-        sum_proc_as_b = PartnerStat.objects.filter(b=OuterRef("pk")) \
-            .values("b") \
-            .annotate(s=Sum("msg_processed_count")) \
-            .values("s")[:1]
+    # max_total (limit rozmiaru strony) zmienia się wolno – krótki TTL w cache
+    MAX_TOTAL_CACHE_KEY = "people:max_total"
+    MAX_TOTAL_CACHE_TIMEOUT = 60  # s
 
+    @staticmethod
+    def _partner_stat_sum(field: str):
+        """
+        SELECT SUM(field) FROM partnerstat WHERE a_id = person.id OR b_id = person.id
+        – jedno podzapytanie na kolumnę (zamiast osobnych dla strony 'a' i 'b').
+        SUM jako Func (nie Aggregate) -> brak GROUP BY. Para własna (a == b) pasuje do obu stron,
+        więc liczona podwójnie – jak w sumie po stronie 'a' i po stronie 'b' (i w max_total).
+        """
+        weighted = Case(
+            When(a_id=F("b_id"), then=F(field) * 2),
+            default=F(field),
+            output_field=IntegerField(),
+        )
+        return Coalesce(
+            Subquery(
+                PartnerStat.objects
+                .filter(Q(a_id=OuterRef("pk")) | Q(b_id=OuterRef("pk")))
+                .order_by()
+                .annotate(s=Func(weighted, function="SUM"))
+                .values("s")[:1],
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    def get_queryset(self):
         qs = (
             Person.objects
             .annotate(
-                total_from_a=Coalesce(Subquery(sum_as_a, output_field=IntegerField()), Value(0)),
-                total_from_b=Coalesce(Subquery(sum_as_b, output_field=IntegerField()), Value(0)),
-                total_proc_from_a=Coalesce(Subquery(sum_proc_as_a, output_field=IntegerField()), Value(0)),
-                total_proc_from_b=Coalesce(Subquery(sum_proc_as_b, output_field=IntegerField()), Value(0)),
-            )
-            .annotate(
-                total_messages=F("total_from_a") + F("total_from_b"),
-                total_processed=F("total_proc_from_a") + F("total_proc_from_b"),
+                total_messages=self._partner_stat_sum("msg_count"),
+                total_processed=self._partner_stat_sum("msg_processed_count"),
             )
             .order_by("-total_messages", "email")
         )
         return qs
 
     def list(self, request, *args, **kwargs):
-        qs = self.get_queryset()
-        aggregate = qs.aggregate(s=Sum("total_messages"))
-        max_total = aggregate["s"] or 0
+        # suma total_messages po wszystkich osobach = każda para liczona po obu stronach -> 2 × SUM(msg_count);
+        # jedno agregowanie PartnerStat zamiast ponownego liczenia podzapytań dla każdej osoby (zapamiętane na TTL)
+        max_total = cache.get_or_set(
+            self.MAX_TOTAL_CACHE_KEY,
+            lambda: 2 * (PartnerStat.objects.aggregate(s=Sum("msg_count"))["s"] or 0),
+            self.MAX_TOTAL_CACHE_TIMEOUT,
+        )
 
         if self.paginator:
             self.paginator.max_page_size = max_total or self.paginator.max_page_size
@@ -137,38 +171,36 @@ class PersonViewSet(viewsets.ReadOnlyModelViewSet):
     def partners(self, request, pk=None):
         person = self.get_object()
 
+        def partner_side(field, output_field=None):
+            # kolumna osoby "po drugiej stronie" pary (JOIN na a i b w tym samym zapytaniu)
+            return Case(
+                When(a_id=person.id, then=F(f"b__{field}")),
+                default=F(f"a__{field}"),
+                output_field=output_field,
+            )
+
         stats = (
             PartnerStat.objects
             .exclude(a=F("b"))  # para musi być nieuporządkowana, ale nie a==b
             .filter(Q(a=person) | Q(b=person))
             .annotate(
-                partner_id=Case(
-                    When(a_id=person.id, then=F("b_id")),
-                    default=F("a_id"),
-                    output_field=IntegerField(),
-                )
+                partner_id=partner_side("id", IntegerField()),
+                partner_email=partner_side("email"),
+                partner_display_name=partner_side("display_name"),
+                partner_domain=partner_side("domain"),
             )
             .order_by("-msg_count", "-last_message_at")
         )
 
-        partner_ids = list(stats.values_list("partner_id", flat=True))
-        partners = {p.id: p for p in Person.objects.filter(id__in=partner_ids)}
-
-        data = []
-        for s in stats:
-            p = partners.get(s.partner_id)
-            if not p:
-                continue
-            data.append({
-                "id": p.id,
-                "email": p.email,
-                "display_name": p.display_name,
-                "domain": p.domain,
-                "msg_count": s.msg_count,
-                "msg_processed_count": s.msg_processed_count,
-                "last_message_at": s.last_message_at,
-            })
-        return Response(data)
+        # kolejność kolumn = PartnerRow
+        data = [
+            PartnerRow.from_row(row)
+            for row in stats.values_list(
+                "partner_id", "partner_email", "partner_display_name", "partner_domain",
+                "msg_count", "msg_processed_count", "last_message_at",
+            ).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        ]
+        return json_response(data)
 
     @action(detail=True, methods=["get"])
     def conversations(self, request, pk=None):
@@ -181,42 +213,85 @@ class PersonViewSet(viewsets.ReadOnlyModelViewSet):
         if not partner_id:
             return Response({"detail": "Missing 'with' (partner id)."}, status=400)
 
-        partner = Person.objects.get(pk=partner_id)
-
-        from django.db.models import Exists, OuterRef  # upewnij się, że masz import
-        def involves(p):
-            return Q(from_person=p) | Q(delivered_to=p) | Exists(
-                MessageRecipient.objects.filter(message=OuterRef("pk"), person=p)
-            )
-
-        msgs = EmailMessage.objects.filter(involves(person) & involves(partner), thread__isnull=False)
-
-        threads = (
-            Thread.objects.filter(messages__in=msgs)
+        try:
+            partner_id = int(partner_id)
+        except (TypeError, ValueError):
+            return Response({"detail": "Invalid 'with' (partner id)."}, status=400)
+
+        # wiadomości, w których person/partner są adresatami – jedno zapytanie zamiast dwóch Exists per wiersz
+        recipient_msg_ids = {person.id: set(), partner_id: set()}
+        for message_id, person_id in (
+            MessageRecipient.objects
+            .filter(person_id__in=recipient_msg_ids.keys())
+            .values_list("message_id", "person_id")
+        ):
+            recipient_msg_ids[person_id].add(message_id)
+
+        def involves(p_id):
+            return Q(from_person_id=p_id) | Q(delivered_to_id=p_id) | Q(id__in=recipient_msg_ids[p_id])
+
+        # grupowanie po wątku bezpośrednio na wiadomościach: zwykły Count("id") zamiast Count(distinct)
+        # przez JOIN Thread->messages; kolejność kolumn = ThreadRow
+        rows = (
+            EmailMessage.objects
+            .filter(involves(person.id) & involves(partner_id), thread__isnull=False)
+            .values("thread_id")
             .annotate(
-                message_count=Count("messages", filter=Q(messages__in=msgs), distinct=True),
-                last_activity_at=Max("messages__received_at")
+                matched_messages=Count("id"),
+                last_activity=Coalesce(Max("received_at"), Max("sent_at")),
+            )
+            .order_by("-last_activity", "-thread_id")
+            .values_list(
+                "thread_id", "thread__thread_key", "thread__subject_norm", "thread__created_at",
+                "matched_messages", "last_activity",
             )
-            .order_by("-last_activity_at","-id")
         )
-        return Response(ThreadSerializer(threads, many=True).data)
-    
+        return Response([ThreadRow.from_row(row) for row in rows.iterator(chunk_size=ITERATOR_CHUNK_SIZE)])
+
+
+_TRUE_VALUES = frozenset({"1", "true", "yes", "y", "t"})
 
 def _get_bool(request, name: str, default: bool) -> bool:
     val = request.query_params.get(name, None)
     if val is None:
         return default
-    return str(val).lower() in {"1", "true", "yes", "y", "t"}
+    return val.lower() in _TRUE_VALUES
+
+_ALLOWED_KINDS = {
+    "TO": MessageRecipient.Kind.TO,
+    # "CC": MessageRecipient.Kind.CC,
+    # "BCC": MessageRecipient.Kind.BCC,
+}
+# Domyślnie tylko TO – zgodnie z sync_partner_stats.py
+_DEFAULT_KINDS = (MessageRecipient.Kind.TO,)
 
 def _parse_kinds(param: str | None):
-    # Domyślnie tylko TO – zgodnie z sync_partner_stats.py
-    kinds_csv = (param or "TO").upper()
-    allowed = {
-        "TO": MessageRecipient.Kind.TO,
-        # "CC": MessageRecipient.Kind.CC,
-        # "BCC": MessageRecipient.Kind.BCC,
-    }
-    return [allowed[k.strip()] for k in kinds_csv.split(",") if k.strip()]
+    # brak parametru (najczęstszy przypadek) -> stała krotka, bez parsowania
+    if not param:
+        return _DEFAULT_KINDS
+    return _parse_kinds_csv(param)
+
+@lru_cache(maxsize=32)
+def _parse_kinds_csv(param: str):
+    # krotka (niemutowalna), bo wynik jest współdzielony przez lru_cache
+    return tuple(_ALLOWED_KINDS[k.strip()] for k in param.upper().split(",") if k.strip())
+
+def _pair_q(a_id: int, b_id: int, kind_values: tuple) -> Q:
+    """
+    Reguła pary z sync_partner_stats.py:
+    from_person ↔ (delivered_to ∪ recipients[kinds]) – w obu kierunkach.
+    Adresaci przez EXISTS (semi-join) – bez JOIN-u mnożącego wiersze, więc bez DISTINCT.
+    """
+    def recipient(person_id):
+        return Exists(MessageRecipient.objects.filter(
+            message=OuterRef("pk"), person_id=person_id, kind__in=kind_values,
+        ))
+
+    return (
+        Q(from_person_id=a_id) & (Q(delivered_to_id=b_id) | recipient(b_id))
+    ) | (
+        Q(from_person_id=b_id) & (Q(delivered_to_id=a_id) | recipient(a_id))
+    )
 
 class MessageViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -227,12 +302,50 @@ class MessageViewSet(viewsets.ReadOnlyModelViewSet):
         [&only_user_processed=true|false]  (domyślnie false)
         [&with_user_processed=true|false]  (domyślnie true)
         [&kinds=TO|TO,CC,BCC]              (domyślnie TO – tak jak w sync_partner_stats.py)
+        [&direction=sent|received]         (domyślnie oba kierunki)
+        [&include=body]                    (lista domyślnie bez treści: text_processed/text_html_parsed/text_plain)
+        [&paging=cursor]                   (paginacja kursorowa po id zamiast numerów stron)
         Jeśli all=true → zwracamy wszystkie elementy w jednej odpowiedzi (bez paginacji).
+    GET /api/messages/<id>/ zawsze zwraca pełną treść.
     """
     serializer_class = EmailMessageSerializer
     pagination_class = SmallPage
     permission_classes = [permissions.IsAuthenticated]
 
+    # kolumny nigdy nieserializowane + treści pomijane w liście bez include=body
+    UNUSED_FIELDS = ("text_html", "raw_payload")
+    BODY_FIELDS = ("text_plain", "text_html_parsed", "text_processed")
+    # adresaci: tylko kolumny używane przez PersonSerializer
+    RECIPIENTS_QS = Person.objects.only("id", "email", "display_name", "domain")
+    # all=true bez treści: projekcja wiadomości z osobami (kolejność = pola EmailMessageListSerializer)
+    LIST_ROW_FIELDS = (
+        "id", "subject", "direction", "sent_at", "received_at",
+        "from_person_id", "from_person__email", "from_person__display_name", "from_person__domain",
+        "delivered_to_id", "delivered_to__email", "delivered_to__display_name", "delivered_to__domain",
+        "thread_id", "useless",
+    )
+    RECIPIENT_ROW_FIELDS = ("message_id", "person_id", "person__email", "person__display_name", "person__domain")
+
+    def _list_without_body(self) -> bool:
+        return self.action == "list" and self.request.query_params.get("include") != "body"
+
+    def get_serializer_class(self):
+        if self._list_without_body():
+            return EmailMessageListSerializer
+        return super().get_serializer_class()
+
+    @property
+    def paginator(self):
+        """
+        paging=cursor → MessageCursorPage (głębokie strony bez OFFSET); domyślnie SmallPage.
+        """
+        if not hasattr(self, "_paginator"):
+            if self.request.query_params.get("paging") == "cursor":
+                self._paginator = MessageCursorPage()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def paginate_queryset(self, queryset):
         """
         Obsługa parametru all=true → wyłącza paginację.
@@ -251,15 +364,70 @@ class MessageViewSet(viewsets.ReadOnlyModelViewSet):
             return self.get_paginated_response(serializer.data)
 
         # brak paginacji – zwracamy wszystkie
-        serializer = self.get_serializer(queryset, many=True)
+        if self._list_without_body():
+            return Response(self._list_rows(queryset))
+
+        # z treścią: instancje modeli (z prefetchem per porcja) nie zostają w pamięci
+        serializer = self.get_serializer(queryset.iterator(chunk_size=ITERATOR_CHUNK_SIZE), many=True)
         return Response(serializer.data)
 
+    def _list_rows(self, queryset):
+        """
+        all=true bez treści: słowniki wprost z values_list – bez instancji modeli i serializera per wiersz.
+        Adresaci jednym zapytaniem na porcję ITERATOR_CHUNK_SIZE; każda osoba budowana raz (jak _person_cache).
+        """
+        persons = {}
+
+        def person(pk, email, display_name, domain):
+            if pk is None:
+                return None
+            return persons.get(pk) or persons.setdefault(pk, {
+                "id": pk,
+                "email": email,
+                "display_name": display_name,
+                "domain": domain,
+            })
+
+        rows = (
+            queryset.select_related(None).prefetch_related(None)
+            .values_list(*self.LIST_ROW_FIELDS)
+            .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        )
+        result = []
+        while chunk := list(islice(rows, ITERATOR_CHUNK_SIZE)):
+            recipients = defaultdict(list)
+            recipient_rows = (
+                MessageRecipient.objects
+                .filter(message_id__in=[row[0] for row in chunk])
+                .order_by("id")
+                .values_list(*self.RECIPIENT_ROW_FIELDS)
+            )
+            for message_id, *recipient in recipient_rows:
+                recipients[message_id].append(person(*recipient))
+
+            for row in chunk:
+                result.append({
+                    "id": row[0],
+                    "subject": row[1],
+                    "direction": row[2],
+                    # strefa lokalna jak w EmailMessageSerializer (lista stronicowana / szczegóły)
+                    "sent_at": local_datetime(row[3]),
+                    "received_at": local_datetime(row[4]),
+                    "from_person": person(*row[5:9]),
+                    "delivered_to": person(*row[9:13]),
+                    "recipients": recipients.get(row[0], []),
+                    "thread_id": row[13],
+                    "useless": row[14],
+                })
+        return result
+
 
     def get_queryset(self):
         params = self.request.query_params
         person_id = params.get("person")
         with_id = params.get("with")
         thread_id = params.get("thread")
+        direction = params.get("direction")
 
         only_useless = _get_bool(self.request, "only_useless", False)
         with_useless = _get_bool(self.request, "with_useless", True)
@@ -271,6 +439,9 @@ class MessageViewSet(viewsets.ReadOnlyModelViewSet):
         except KeyError:
             return EmailMessage.objects.none()
 
+        if direction and direction not in EmailMessage.Direction.values:
+            return EmailMessage.objects.none()
+
         qs = EmailMessage.objects.exclude(
             (Q(from_person=F("delivered_to")) & Q(recipients__isnull=True)) |
             Q(text_processed=False)
@@ -296,58 +467,57 @@ class MessageViewSet(viewsets.ReadOnlyModelViewSet):
             except (TypeError, ValueError):
                 return EmailMessage.objects.none()
 
-            # Sprawdzenie w PartnerStat (a<b)
-            x, y = (a_id, b_id) if a_id < b_id else (b_id, a_id)
-            if not PartnerStat.objects.filter(a_id=x, b_id=y).exists():
+            # Sprawdzenie w PartnerStat (a<b) – wynik z cache
+            if not PartnerStat.pair_exists(a_id, b_id):
                 return EmailMessage.objects.none()
 
-            # Dokładnie ta sama reguła, co w sync_partner_stats.py:
-            # from_person ↔ (delivered_to ∪ recipients[kinds]) – w obu kierunkach
-            pair_q = (
-                Q(from_person_id=a_id) & (
-                    Q(delivered_to_id=b_id) |
-                    Q(message_recipients__person_id=b_id,
-                      message_recipients__kind__in=kind_values)
-                )
-            ) | (
-                Q(from_person_id=b_id) & (
-                    Q(delivered_to_id=a_id) |
-                    Q(message_recipients__person_id=a_id,
-                      message_recipients__kind__in=kind_values)
-                )
-            )
-            qs = qs.filter(pair_q).distinct()
+            # Dokładnie ta sama reguła, co w sync_partner_stats.py (EXISTS zamiast JOIN + distinct())
+            qs = qs.filter(_pair_q(a_id, b_id, kind_values))
 
         if thread_id:
             qs = qs.filter(thread_id=thread_id)
 
-        return qs.select_related("from_person", "delivered_to", "thread") \
+        if direction:
+            qs = qs.filter(direction=direction)
+
+        deferred = self.UNUSED_FIELDS + (self.BODY_FIELDS if self._list_without_body() else ())
+
+        # thread: serializer czyta tylko thread_id (kolumna FK) – bez JOIN-u i kolumn Thread
+        return qs.select_related("from_person", "delivered_to") \
+                 .prefetch_related(Prefetch("recipients", queryset=self.RECIPIENTS_QS)) \
+                 .defer(*deferred) \
                  .order_by("received_at", "sent_at", "id")
 
-    # ------- AKCJE ZMIENIAJĄCE POLE 'useless' -------
+    # ------- AKCJE ZMIENIAJĄCE FLAGI (UPDATE zamiast get_object() + save()) -------
+
+    # kolumny potrzebne do 404 i przeliczenia par PartnerStat
+    FLAG_FIELDS = ("id", "from_person_id", "delivered_to_id")
+
+    def _set_flag(self, pk, field: str):
+        """
+        Ustawia flagę jednym UPDATE ... WHERE <flag> = false (bez odczytu całego wiersza i bez
+        sygnałów pre_save/post_save). Zmiana wpływa na msg_processed_count – PartnerStat
+        przeliczamy jawnie, tylko gdy wiersz faktycznie się zmienił.
+        """
+        msg = get_object_or_404(EmailMessage.objects.only(*self.FLAG_FIELDS), pk=pk)
+        if EmailMessage.objects.filter(pk=msg.pk, **{field: False}).update(**{field: True}):
+            recompute_partner_stats_for_message(msg)
+        return msg
 
     @action(detail=True, methods=["post"], url_path="mark-useless")
     def mark_useless(self, request, pk=None):
         """
         POST /api/messages/{id}/mark-useless/
         """
-        msg = self.get_object()
-        if not msg.useless:
-            msg.useless = True
-            msg.save(update_fields=["useless"])
+        msg = self._set_flag(pk, "useless")
         return Response({"id": msg.id, "useless": True}, status=status.HTTP_200_OK)
 
-    # ------- AKCJE ZMIENIAJĄCE POLE 'user_processed' -------
-
     @action(detail=True, methods=["post"], url_path="mark-processed")
     def mark_user_processed(self, request, pk=None):
         """
         POST /api/messages/{id}/mark-processed/
         """
-        msg = self.get_object()
-        if not msg.user_processed:
-            msg.user_processed = True
-            msg.save(update_fields=["user_processed"])
+        msg = self._set_flag(pk, "user_processed")
         return Response({"id": msg.id, "user_processed": True}, status=status.HTTP_200_OK)
 
 
@@ -381,18 +551,25 @@ class ThreadViewSet(viewsets.ReadOnlyModelViewSet):
         return super().paginate_queryset(queryset)
 
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
+        # projekcja 1:1 z polami ThreadSerializer – wiersze ThreadRow zamiast serializacji pole po polu
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*ThreadRow._fields)
 
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            return self.get_paginated_response([ThreadRow.from_row(row) for row in page])
 
         # brak paginacji – zwracamy wszystkie
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return Response([ThreadRow.from_row(row) for row in queryset.iterator(chunk_size=ITERATOR_CHUNK_SIZE)])
 
 
+    @staticmethod
+    def _no_threads():
+        # pusty QS z tymi samymi adnotacjami co wynik – list() robi values_list(*ThreadRow._fields)
+        return Thread.objects.none().annotate(
+            matched_messages=Value(0, output_field=IntegerField()),
+            last_activity=Value(None, output_field=DateTimeField()),
+        )
+
     def get_queryset(self):
         params = self.request.query_params
         person_id = params.get("person")
@@ -401,28 +578,27 @@ class ThreadViewSet(viewsets.ReadOnlyModelViewSet):
 
         if not person_id or not with_id:
             # wymagamy obu identyfikatorów, bo to 'wątki między wskazanymi osobami'
-            return Thread.objects.none()
+            return self._no_threads()
         try:
             a_id = int(person_id)
             b_id = int(with_id)
         except (TypeError, ValueError):
-            return Thread.objects.none()
+            return self._no_threads()
 
         # kinds (TO/CC/BCC)
         try:
             kind_values = _parse_kinds(params.get("kinds"))
         except KeyError:
-            return Thread.objects.none()
+            return self._no_threads()
 
         only_useless = _get_bool(self.request, "only_useless", False)
         with_useless = _get_bool(self.request, "with_useless", True)
         only_user_processed = _get_bool(self.request, "only_user_processed", False)
         with_user_processed = _get_bool(self.request, "with_user_processed", True)
 
-        # Mikro-optymalizacja: sprawdź w PartnerStat, czy para w ogóle istnieje
-        x, y = (a_id, b_id) if a_id < b_id else (b_id, a_id)
-        if not PartnerStat.objects.filter(a_id=x, b_id=y).exists():
-            return Thread.objects.none()
+        # Mikro-optymalizacja: sprawdź w PartnerStat (cache), czy para w ogóle istnieje
+        if not PartnerStat.pair_exists(a_id, b_id):
+            return self._no_threads()
 
         # Bazowe QS po wiadomościach – *tylko* te, które pasują do filtrów "useless/user_processed/since"
         msgs = EmailMessage.objects.all()
@@ -443,35 +619,31 @@ class ThreadViewSet(viewsets.ReadOnlyModelViewSet):
         if since:
             msgs = msgs.filter(Q(sent_at__date__gte=since) | Q(received_at__date__gte=since))
 
-        # Reguła pary, identyczna jak w MessageViewSet:
-        pair_q = (
-            Q(from_person_id=a_id) & (
-                Q(delivered_to_id=b_id) |
-                Q(message_recipients__person_id=b_id,
-                  message_recipients__kind__in=kind_values)
-            )
-        ) | (
-            Q(from_person_id=b_id) & (
-                Q(delivered_to_id=a_id) |
-                Q(message_recipients__person_id=a_id,
-                  message_recipients__kind__in=kind_values)
-            )
-        )
-        msgs = msgs.filter(pair_q)
-
-        # Z tego subzapytania budujemy QS wątków:
+        # Reguła pary, identyczna jak w MessageViewSet. Id pasujących wiadomości liczymy raz:
+        # typowa para ma ich niewiele, więc do wątków idzie zwykła lista IN (...), a nie zagnieżdżone
+        # podzapytanie z EXISTS; przy bardzo dużej parze zostajemy przy podzapytaniu (limit parametrów SQL).
+        msg_ids_qs = msgs.filter(_pair_q(a_id, b_id, kind_values)).values_list("id", flat=True)
+        msg_ids = list(msg_ids_qs[:MATERIALIZED_IDS_MAX + 1])
+        if not msg_ids:
+            return self._no_threads()
+        if len(msg_ids) > MATERIALIZED_IDS_MAX:
+            msg_ids = Subquery(msg_ids_qs)
+
+        # Z tych id budujemy QS wątków:
         #  - tylko wątki, które mają co najmniej jedną taką wiadomość,
         #  - adnotujemy liczbę takich wiadomości i "ostatnią aktywność" (max z sent_at/received_at).
+        # Adnotacje korzystają z JOIN-u z filter() (już zawężonego do msg_ids), więc wystarcza zwykły
+        # Count("messages__id") – bez filter=/distinct i bez zewnętrznego .distinct().
         threads = (
             Thread.objects
-            .filter(messages__in=msgs)
+            .filter(messages__id__in=msg_ids)
             .annotate(
-                matched_messages=Count("messages", filter=Q(messages__in=msgs), distinct=True),
-                last_activity=Max(Coalesce("messages__received_at", "messages__sent_at")),
+                matched_messages=Count("messages__id"),
+                # agregaty na gołych kolumnach (indeksy thread+received_at / thread+sent_at),
+                # nie na wyrażeniu per wiersz
+                last_activity=Coalesce(Max("messages__received_at"), Max("messages__sent_at")),
             )
-            .order_by("-last_activity", "-id")
             .order_by("-matched_messages", "-last_activity", "-id")
-            .distinct()
         )
 
         # Dodatkowo możesz chcieć prefetch/only, ale to zależy od Twojego ThreadSerializer
@@ -479,13 +651,45 @@ class ThreadViewSet(viewsets.ReadOnlyModelViewSet):
 
 # ------------------- SŁOWNIKI (dynamicznie) ---------------------------------
 
+def _dictionaries_state(request) -> tuple:
+    """
+    (max(updated_at), liczba) dla wszystkich zestawów – jedno zapytanie na żądanie (zapamiętane na request).
+    Liczba wyłapuje usunięcia, których sam max(updated_at) by nie pokazał.
+    """
+    state = getattr(request, "_dictionaries_state", None)
+    if state is None:
+        agg = Dictionary.objects.aggregate(last=Max("updated_at"), n=Count("id"))
+        state = (agg["last"], agg["n"])
+        request._dictionaries_state = state
+    return state
+
+
+def _dictionaries_etag(request, *args, **kwargs):
+    last, n = _dictionaries_state(request)
+    return f'"{last.timestamp() if last else 0}-{n}"'
+
+
+def _dictionaries_last_modified(request, *args, **kwargs):
+    return _dictionaries_state(request)[0]
+
+
+dictionaries_conditional = method_decorator(
+    condition(etag_func=_dictionaries_etag, last_modified_func=_dictionaries_last_modified)
+)
+
+
 class DictionaryViewSet(viewsets.ReadOnlyModelViewSet):
     """
     GET /api/dictionaries/?active=true|false
+    Dane referencyjne: ETag/Last-Modified (304 Not Modified, gdy zestawy się nie zmieniły)
+    i lista trzymana w cache pod kluczem zależnym od stanu tabeli.
     """
+    serializer_class = DictionarySerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = None
 
+    CACHE_MAX_AGE = 60  # s – Cache-Control dla klienta (dane prywatne: za uwierzytelnieniem)
+
     def get_queryset(self):
         qs = Dictionary.objects.all().order_by("-is_active", "code", "version", "locale")
         active = self.request.query_params.get("active")
@@ -494,24 +698,36 @@ class DictionaryViewSet(viewsets.ReadOnlyModelViewSet):
             qs = qs.filter(is_active=flag)
         return qs
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if response.status_code in (200, 304):
+            patch_cache_control(response, private=True, max_age=self.CACHE_MAX_AGE)
+        return response
+
+    @dictionaries_conditional
     def list(self, request, *args, **kwargs):
-        data = [{
-            "id": d.id,
-            "code": d.code,
-            "name": d.name,
-            "description": d.description,
-            "version": d.version,
-            "locale": d.locale,
-            "is_active": d.is_active,
-        } for d in self.get_queryset()]
+        # klucz zawiera ETag – każda zmiana/usunięcie zestawu unieważnia wpis
+        key = f"api:dictionaries:{_dictionaries_etag(request)}:{request.query_params.get('active')}"
+        data = cache.get(key)
+        if data is None:
+            # values() – bez instancji modeli; wiersze mają już docelowy kształt
+            data = list(self.get_queryset().values(
+                "id", "code", "name", "description", "version", "locale", "is_active",
+            ))
+            cache.set(key, data, self.CACHE_MAX_AGE)
         return Response(data)
 
+    @dictionaries_conditional
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class DictionaryKindViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Rodzaje etykiet dla zadanego zestawu lub globalnie.
     GET /api/dict-kinds/?dictionary=<id>  (opcjonalnie)
     """
+    serializer_class = DictionaryKindSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = None
 
@@ -520,22 +736,33 @@ class DictionaryKindViewSet(viewsets.ReadOnlyModelViewSet):
         dictionary_id = self.request.query_params.get("dictionary")
         if dictionary_id:
             qs = qs.filter(dictionary_id=dictionary_id)
-        return qs.select_related("dictionary")
+        return qs.select_related("dictionary").only(
+            "id", "code", "name", "description", "dictionary_id",
+            "dictionary__id", "dictionary__code", "dictionary__name",
+            "dictionary__version", "dictionary__locale", "dictionary__is_active",
+        )
 
     def list(self, request, *args, **kwargs):
+        # Ten sam kształt co DictionaryKindSerializer, ale z krotek values() (bez instancji modeli)
+        rows = self.get_queryset().values(
+            "id", "code", "name", "description",
+            "dictionary_id", "dictionary__code", "dictionary__name",
+            "dictionary__version", "dictionary__locale", "dictionary__is_active",
+        )
         data = [{
-            "id": k.id,
-            "code": k.code,
-            "name": k.name,
-            "description": k.description,
+            "id": r["id"],
+            "code": r["code"],
+            "name": r["name"],
+            "description": r["description"],
             "dictionary": {
-                "id": k.dictionary_id,
-                "code": k.dictionary.code,
-                "version": k.dictionary.version,
-                "locale": k.dictionary.locale,
-                "is_active": k.dictionary.is_active,
+                "id": r["dictionary_id"],
+                "code": r["dictionary__code"],
+                "name": r["dictionary__name"],
+                "version": r["dictionary__version"],
+                "locale": r["dictionary__locale"],
+                "is_active": r["dictionary__is_active"],
             },
-        } for k in self.get_queryset()]
+        } for r in rows]
         return Response(data)
 
 
@@ -544,6 +771,7 @@ class DictionaryValueViewSet(viewsets.ReadOnlyModelViewSet):
     Wartości etykiet (filtrowalne po rodzaju i/lub zestawie).
     GET /api/dict-values/?kind=<code>&dictionary=<id>
     """
+    serializer_class = DictionaryValueSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = None
 
@@ -557,29 +785,55 @@ class DictionaryValueViewSet(viewsets.ReadOnlyModelViewSet):
         if dictionary_id:
             qs = qs.filter(kind__dictionary_id=dictionary_id)
 
-        return qs.select_related("kind", "kind__dictionary")
+        # label_count: skorelowany COUNT bez GROUP BY – bez JOIN-u LabelFinal mnożącego wiersze
+        # i bez grupowania po wszystkich kolumnach z select_related (lista i retrieve)
+        label_count = (
+            LabelFinal.objects
+            .filter(value=OuterRef("pk"))
+            .order_by()
+            .annotate(c=Func(F("id"), function="COUNT"))
+            .values("c")[:1]
+        )
+
+        return qs.select_related("kind", "kind__dictionary").only(
+            "id", "code", "name", "description", "sort_order", "is_active", "kind_id",
+            "kind__id", "kind__code", "kind__name", "kind__dictionary_id",
+            "kind__dictionary__id", "kind__dictionary__code",
+            "kind__dictionary__version", "kind__dictionary__locale",
+        ).annotate(label_count=Subquery(label_count, output_field=IntegerField()))
 
     def list(self, request, *args, **kwargs):
+        # Ten sam kształt co DictionaryValueSerializer, ale z values(); label_count z adnotacji get_queryset
+        rows = (
+            self.get_queryset()
+            .values(
+                "id", "code", "name", "description", "sort_order", "is_active",
+                "kind_id", "kind__code", "kind__name",
+                "kind__dictionary_id", "kind__dictionary__code",
+                "kind__dictionary__version", "kind__dictionary__locale",
+                "label_count",
+            )
+        )
         data = [{
-            "id": v.id,
-            "code": v.code,
-            "name": v.name,
-            "description": v.description,
-            "sort_order": v.sort_order,
-            "is_active": v.is_active,
+            "id": r["id"],
+            "code": r["code"],
+            "name": r["name"],
+            "description": r["description"],
+            "sort_order": r["sort_order"],
+            "is_active": r["is_active"],
             "kind": {
-                "id": v.kind_id,
-                "code": v.kind.code,
-                "name": v.kind.name,
+                "id": r["kind_id"],
+                "code": r["kind__code"],
+                "name": r["kind__name"],
             },
             "dictionary": {
-                "id": v.kind.dictionary_id,
-                "code": v.kind.dictionary.code,
-                "version": v.kind.dictionary.version,
-                "locale": v.kind.dictionary.locale,
+                "id": r["kind__dictionary_id"],
+                "code": r["kind__dictionary__code"],
+                "version": r["kind__dictionary__version"],
+                "locale": r["kind__dictionary__locale"],
             },
-            "label_count": v.final_for_samples.count()
-        } for v in self.get_queryset()]
+            "label_count": r["label_count"],
+        } for r in rows]
         return Response(data)
 
 
@@ -632,87 +886,108 @@ class LabelViewSet(mixins.CreateModelMixin,
             return Response({"detail": "Brak danych."}, status=400)
 
         # 1) Walidacja referencji kind/value (drugi przebieg użyje już obiektów)
-        kinds_cache = {}
-        values_cache = {}
         for i, item in enumerate(items, start=1):
             content = (item.get("content") or "").strip()
-            kind_id = item.get("kind")
-            value_id = item.get("value")
-            if not content or not kind_id or not value_id:
+            if not content or not item.get("kind") or not item.get("value"):
                 return Response(
                     {"detail": f"[{i}] Wymagane pola: content, kind, value."},
                     status=400,
                 )
-            try:
-                kind = kinds_cache[kind_id]
-            except KeyError:
-                try:
-                    kind = DictionaryKind.objects.get(pk=kind_id)
-                except DictionaryKind.DoesNotExist:
-                    return Response({"detail": f"[{i}] Nieznany rodzaj: {kind_id!r}."}, status=404)
-                kinds_cache[kind_id] = kind
 
+        def as_pk(raw):
             try:
-                value = values_cache[(kind_id, value_id)]
-            except KeyError:
-                try:
-                    value = DictionaryValue.objects.get(kind=kind, pk=value_id, is_active=True)
-                except DictionaryValue.DoesNotExist:
-                    return Response(
-                        {"detail": f"[{i}] Nieznana wartość: {value_id!r} dla rodzaju {kind.code!r}."},
-                        status=404,
-                    )
-                values_cache[(kind_id, value_id)] = value
-
-        # 2) Przetwarzanie: Sample -> Annotation -> LabelFinal
-        resp = []
-        user = request.user
-        for item in items:
-            content = (item.get("content") or "").strip()
-            preprocess_version = (item.get("preprocess_version") or "v1").strip()
-            lang = (item.get("lang") or "").strip()
+                return int(raw)
+            except (TypeError, ValueError):
+                return None
 
-            snippet = (item.get("snippet") or "").strip()
-            comment = (item.get("comment") or "").strip()
+        # wszystkie rodzaje i wartości z partii – dwa zapytania IN zamiast get() per pozycja
+        kinds_by_pk = DictionaryKind.objects.in_bulk({as_pk(item["kind"]) for item in items} - {None})
+        values_by_pk = DictionaryValue.objects.filter(is_active=True).in_bulk(
+            {as_pk(item["value"]) for item in items} - {None}
+        )
 
-            kind = kinds_cache[item["kind"]]
-            value = values_cache[(item["kind"], item["value"])]
+        kinds_cache = {}
+        values_cache = {}
+        for i, item in enumerate(items, start=1):
+            kind_id = item["kind"]
+            value_id = item["value"]
 
-            # a) deduplikacja treści – DatasetSample
-            sample, _created = DatasetSample.objects.get_or_create_from_text(
-                content, preprocess_version=preprocess_version, lang=lang or "pl"
-            )
+            kind = kinds_by_pk.get(as_pk(kind_id))
+            if kind is None:
+                return Response({"detail": f"[{i}] Nieznany rodzaj: {kind_id!r}."}, status=404)
+            kinds_cache[kind_id] = kind
 
-            # b) adnotacja użytkownika (z evidence_snippet + comment)
-            ann = Annotation.objects.create(
+            value = values_by_pk.get(as_pk(value_id))
+            if value is None or value.kind_id != kind.id:
+                return Response(
+                    {"detail": f"[{i}] Nieznana wartość: {value_id!r} dla rodzaju {kind.code!r}."},
+                    status=404,
+                )
+            values_cache[(kind_id, value_id)] = value
+
+        # 2) Przetwarzanie: Sample -> Annotation -> LabelFinal (wsadowo)
+        user = request.user
+        rows = []
+        for item in items:
+            rows.append({
+                "content": (item.get("content") or "").strip(),
+                "preprocess_version": (item.get("preprocess_version") or "v1").strip(),
+                "lang": (item.get("lang") or "").strip(),
+                "snippet": (item.get("snippet") or "").strip(),
+                "comment": (item.get("comment") or "").strip(),
+                "kind": kinds_cache[item["kind"]],
+                "value": values_cache[(item["kind"], item["value"])],
+            })
+
+        # a) deduplikacja treści – DatasetSample
+        samples = DatasetSample.objects.get_or_create_many_from_texts(
+            [(r["content"], r["preprocess_version"], r["lang"] or "pl") for r in rows]
+        )
+
+        # b) adnotacje użytkownika (z evidence_snippet + comment) – jeden INSERT
+        anns = Annotation.objects.bulk_create([
+            Annotation(
                 sample=sample,
-                kind=kind,
-                value=value,
+                kind=r["kind"],
+                value=r["value"],
                 annotator=user,
                 confidence=1.0,
-                evidence_snippet=snippet,  # <-- kluczowa zmiana
-                comment=comment,
+                evidence_snippet=r["snippet"],  # <-- kluczowa zmiana
+                comment=r["comment"],
             )
-
-            # c) finalna etykieta (1 per sample/kind) – upsert
-            final_obj, _ = LabelFinal.objects.update_or_create(
+            for r, sample in zip(rows, samples)
+        ])
+
+        # c) finalne etykiety (1 per sample/kind) – upsert jednym INSERT ... ON CONFLICT;
+        #    przy powtórzeniu (sample, kind) w partii wygrywa ostatnia pozycja (jak przy kolejnych update_or_create)
+        finals = {}
+        for r, sample in zip(rows, samples):
+            finals[(sample.id, r["kind"].id)] = LabelFinal(
                 sample=sample,
-                kind=kind,
-                defaults={
-                    "value": value,
-                    "evidence_snippet": snippet,  # utrwalamy w finalu również
-                    "comment": comment,
-                }
+                kind=r["kind"],
+                value=r["value"],
+                evidence_snippet=r["snippet"],  # utrwalamy w finalu również
+                comment=r["comment"],
             )
+        LabelFinal.objects.bulk_create(
+            finals.values(),
+            update_conflicts=True,
+            unique_fields=["sample", "kind"],
+            update_fields=["value", "evidence_snippet", "comment"],
+        )
 
+        resp = []
+        for r, sample, ann in zip(rows, samples, anns):
+            kind, value = r["kind"], r["value"]
             resp.append({
                 "sample_id": sample.id,
                 "annotation_id": ann.id,
-                "final_label_id": final_obj.id,
+                "final_label_id": finals[(sample.id, kind.id)].id,
                 "kind": {"id": kind.id, "code": kind.code, "name": kind.name},
                 "value": {"id": value.id, "code": value.code, "name": value.name},
-                "evidence_snippet": final_obj.evidence_snippet,
-                "comment": final_obj.comment,
+                # stan finalu po tej pozycji
+                "evidence_snippet": r["snippet"],
+                "comment": r["comment"],
             })
 
         return Response(resp, status=200)
@@ -725,30 +1000,38 @@ class _LabelPreviewBase(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     # ---- helpers (wspólne) ----
-    def _resolve_kinds(self, input_kinds):
-        qs = DictionaryKind.objects.all()
+    def _resolve_kinds(self, input_kinds, dictionary=None):
+        # podgląd czyta z rodzajów tylko id/code (wiersze) i name (kolejność) – bez opisów
+        qs = DictionaryKind.objects.only("id", "code", "name")
+        # kod rodzaju jest unikalny tylko w zestawie – bez tego filtra kilka wersji słownika
+        # dałoby duplikaty kodów w prompcie i nigdy pełne trafienie w cache podglądu
+        if dictionary is not None:
+            qs = qs.filter(dictionary=dictionary)
         if not input_kinds:
             return qs.filter(is_active=True)
         ids = [k for k in input_kinds if isinstance(k, int) or (isinstance(k, str) and k.isdigit())]
         codes = [k for k in input_kinds if isinstance(k, str) and not k.isdigit()]
-        q = qs.none()
+        # jeden SELECT z OR (zamiast UNION) – wynik można dalej filtrować/sortować i użyć jako kind__in
+        q = Q()
         if ids:
-            q = q.union(qs.filter(pk__in=[int(i) for i in ids]))
+            q |= Q(pk__in=[int(i) for i in ids])
         if codes:
-            q = q.union(qs.filter(code__in=codes))
-        return q.distinct()
+            q |= Q(code__in=codes)
+        return qs.filter(q) if q else qs.none()
 
-    def _build_values_map(self, kinds_qs, dictionary_id):
-        qs = DictionaryValue.objects.filter(kind__in=kinds_qs, is_active=True)
+    def _build_values_map(self, kind_ids, dictionary_id):
+        qs = DictionaryValue.objects.filter(kind_id__in=kind_ids, is_active=True)
         if dictionary_id:
             qs = qs.filter(kind__dictionary_id=dictionary_id)
         out = {}
-        for v in qs.only("id","code","kind_id"):
-            out.setdefault(v.kind_id, {})[v.code] = v.id
+        # krotki strumieniowo zamiast instancji modelu – przy dużych słownikach mniej pamięci
+        for value_id, code, kind_id in qs.values_list("id", "code", "kind_id").iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            out.setdefault(kind_id, {})[code] = value_id
         return out
 
-    def _sort_rows(self, rows, kinds_qs):
-        order = {k.id: idx for idx, k in enumerate(kinds_qs.order_by("name","code"), start=1)}
+    def _sort_rows(self, rows):
+        # kolejność wszystkich rodzajów z cache – podzbiór zachowuje tę samą kolejność
+        order = DictionaryKind.order_map()
         return sorted(rows, key=lambda r: (order.get(r["kind_id"], 9999), r.get("value_code","")))
 
     def _find_dictionary(self, code, version, locale):
@@ -761,25 +1044,12 @@ class _LabelPreviewBase(APIView):
             qs = qs.filter(locale=locale)
         return qs.order_by("-is_active").first()
 
-    def _serialize_cached_preds(self, preds_qs: QuerySet[ModelPrediction]):
-        rows = []
-        for p in preds_qs.select_related("kind", "value"):
-            rows.append({
-                "kind_id": p.kind_id,
-                "kind_code": p.kind.code,
-                "value_id": p.value_id,
-                "value_code": p.value.code,
-                "snippet": p.evidence_snippet or "",
-            })
-        return rows
-
     def _upsert_missing_preds(
         self,
         *,
         email_text: str,
         subject: str | None,
         direction: str | None,
-        kinds_qs: QuerySet[DictionaryKind],
         need_kind_ids: list[int],
         kinds_by_id: dict[int, DictionaryKind],
         dictionary_code: str,
@@ -803,6 +1073,8 @@ class _LabelPreviewBase(APIView):
                 dictionary_code=dictionary_code,
                 dictionary_version=dictionary_version,
                 dictionary_locale=dictionary_locale,
+                # tylko rodzaje bez predykcji w cache – mniejszy katalog w prompcie
+                kind_codes=[kinds_by_id[kid].code for kid in need_kind_ids],
             )
             rows = to_label_rows(raw_args, enums)  # [{"kind_id","value_id","snippet"}...]
             dictionary_id = enums.get("dictionary_id")  # może być None
@@ -811,12 +1083,12 @@ class _LabelPreviewBase(APIView):
             # Zwróć 502, ale zostaw obsługę wyjątku wyżej (w callerze)
             raise
 
-        values_map = self._build_values_map(kinds_qs, dictionary_id)
+        # mapa value_code -> id tylko dla rodzajów, które zapisujemy
+        values_map = self._build_values_map(need_kind_ids, dictionary_id)
         need_kind_ids_set = set(need_kind_ids)
 
-        result_rows = []
-        saved_any = False
-
+        # wiersze do zapisu per kind (przy powtórzonym kind wygrywa ostatni – jak kolejne update_or_create)
+        pending = {}
         for r in rows:
             r_kind_id = r.get("kind_id")
             r_value_id = r.get("value_id")
@@ -832,130 +1104,233 @@ class _LabelPreviewBase(APIView):
                     logger.warning("Brak mapy value_id dla kind_id=%s value_code=%r", r_kind_id, r.get("value_code"))
                     continue
 
-            defaults = {
+            pending[r_kind_id] = {
                 "value_id": r_value_id,
                 "proba": float(r.get("proba", 0.0)) if r.get("proba") is not None else 0.0,
                 "evidence_snippet": snippet,
             }
-            pred_kwargs = dict(
+
+        if not pending:
+            return [], False
+
+        # istniejące predykcje tych rodzajów – jedno zapytanie; ta sama reguła dopasowania co update_or_create
+        # zapis w krótkiej transakcji (po wywołaniu LLM) – błąd bazy wycofuje tylko predykcje tej próbki
+        with transaction.atomic():
+            existing_qs = ModelPrediction.objects.filter(
                 sample=sample,
-                kind_id=r_kind_id,
+                kind_id__in=pending.keys(),
                 model_name=OPENAI_MODEL_NAME,
                 model_version=OPENAI_MODEL_VERSION,
             )
-            if hasattr(ModelPrediction, "dictionary_id") and dictionary_id:
-                pred_kwargs["dictionary_id"] = dictionary_id
+            if dictionary_id:
+                existing_qs = existing_qs.filter(dictionary_id=dictionary_id)
+            existing = {}
+            for pred in existing_qs.only("id", "kind_id"):
+                existing.setdefault(pred.kind_id, pred)
+
+            to_update, to_create = [], []
+            for kind_id, fields in pending.items():
+                pred = existing.get(kind_id)
+                if pred is not None:
+                    for name, value in fields.items():
+                        setattr(pred, name, value)
+                    to_update.append(pred)
+                else:
+                    to_create.append(ModelPrediction(
+                        sample=sample,
+                        kind_id=kind_id,
+                        model_name=OPENAI_MODEL_NAME,
+                        model_version=OPENAI_MODEL_VERSION,
+                        dictionary_id=dictionary_id or None,
+                        **fields,
+                    ))
+
+            # dwa zapytania zamiast SELECT + INSERT/UPDATE na każdy wiersz
+            if to_update:
+                ModelPrediction.objects.bulk_update(to_update, ["value", "proba", "evidence_snippet"])
+            if to_create:
+                ModelPrediction.objects.bulk_create(to_create)
+        # bulk_* nie wysyła sygnałów – cache wierszy podglądu czyścimy jawnie
+        ModelPrediction.forget_preview_rows(sample.pk, OPENAI_MODEL_NAME, OPENAI_MODEL_VERSION, dictionary_id)
+
+        value_codes = dict(
+            DictionaryValue.objects
+            .filter(pk__in={fields["value_id"] for fields in pending.values()})
+            .values_list("id", "code")
+        )
+        result_rows = [
+            {
+                "kind_id": kind_id,
+                "kind_code": kinds_by_id[kind_id].code,
+                "value_id": fields["value_id"],
+                "value_code": value_codes.get(fields["value_id"]),
+                "snippet": fields["evidence_snippet"],
+            }
+            for kind_id, fields in pending.items()
+        ]
+        saved_any = bool(to_create)
+
+        return result_rows, saved_any
+
+    def _preview_sample(
+        self,
+        *,
+        text: str,
+        source: str,
+        subject: str | None,
+        direction: str | None,
+        kinds_by_id: dict[int, DictionaryKind],
+        dictionary_code: str,
+        dictionary_version: str,
+        dictionary_locale: str,
+        dictionary: Dictionary | None,
+    ):
+        """
+        DatasetSample -> cache ModelPrediction -> (brakujące) OpenAI.
+        Zwraca: (payload, status) – payload jak w odpowiedzi pojedynczego podglądu.
+        """
+        sample, _ = DatasetSample.objects.get_or_create_from_text(
+            text,
+            preprocess_version=DEFAULT_PREPROCESS_VERSION,
+            lang="pl",
+            source=source,
+        )
+
+        # cache: zapisane predykcje próbki (Django cache, czyszczony sygnałami ModelPrediction)
+        cached_rows = [
+            row for row in ModelPrediction.preview_rows(
+                sample.pk, OPENAI_MODEL_NAME, OPENAI_MODEL_VERSION,
+                dictionary.pk if dictionary is not None else None,
+            )
+            if row["kind_id"] in kinds_by_id
+        ]
+        cached_kind_ids = {row["kind_id"] for row in cached_rows}
+        need_kind_ids = [kid for kid in kinds_by_id.keys() if kid not in cached_kind_ids]
+        if not need_kind_ids:
+            return {"labels": self._sort_rows(cached_rows), "cached": True}, 200
 
-            pred, created_pred = ModelPrediction.objects.update_or_create(
-                **pred_kwargs, defaults=defaults
+        # missing -> OpenAI
+        try:
+            new_rows, saved_any = self._upsert_missing_preds(
+                email_text=text,
+                subject=subject,
+                direction=direction,
+                need_kind_ids=need_kind_ids,
+                kinds_by_id=kinds_by_id,
+                dictionary_code=dictionary_code,
+                dictionary_version=dictionary_version,
+                dictionary_locale=dictionary_locale,
+                sample=sample,
+                dictionary=dictionary,
             )
-            saved_any = saved_any or created_pred
-
-            result_rows.append({
-                "kind_id": pred.kind_id,
-                "kind_code": kinds_by_id[pred.kind_id].code,
-                "value_id": pred.value_id,
-                "value_code": pred.value.code,
-                "snippet": pred.evidence_snippet or "",
-            })
+        except Exception as e:
+            return {"detail": f"OpenAI error: {e}"}, 502
 
-        return result_rows, saved_any
+        # dołącz to, co było w cache (stan sprzed zapisu nowych predykcji – bez ich dublowania)
+        all_rows = new_rows + cached_rows
+
+        return {"labels": self._sort_rows(all_rows), "cached": False}, 200
 
 
-# ============ 1) Pojedyncza wiadomość ============
+# ============ 1) Pojedyncza wiadomość / partia wiadomości ============
 
 class LabelPreviewMessageView(_LabelPreviewBase):
     """
     POST /api/label/preview/message
     Body:
     {
-      "message_id": 123,
+      "message_id": 123,                         # albo "message_ids": [123, 124, ...] (maks. 64)
       "kinds": ["emotion","style","relation"],   # opcjonalnie
       "dictionary_code": "aiinvite",             # opcjonalnie (domyślnie: aiinvite)
       "dictionary_version": "v1",                # opcjonalnie
       "dictionary_locale": "pl"                  # opcjonalnie
     }
+    Dla message_ids: wiadomości pobierane jednym zapytaniem, kinds/słownik rozwiązywane raz,
+    podglądy liczone równolegle (BATCH_WORKERS wątków; wywołania OpenAI poza transakcją,
+    zapis predykcji każdej wiadomości we własnej krótkiej transakcji);
+    odpowiedź {"results": [{"message_id", "labels", "cached"} | {"message_id", "detail", "status"}]}.
     """
+    MESSAGE_FIELDS = ("id", "subject", "direction", "text_processed")
+    BATCH_WORKERS = 8  # równoległe podglądy partii – czas to głównie oczekiwanie na OpenAI
 
-    @transaction.atomic
-    def post(self, request, *args, **kwargs):
-        message_id = request.data.get("message_id")
-        if not message_id:
-            return Response({"detail": "Brak message_id."}, status=400)
+    @staticmethod
+    def _message_text(msg) -> str:
+        return (msg.text_processed or "") or (msg.subject or "")
 
+    # bez @transaction.atomic: transakcja nie może obejmować wywołań OpenAI (partia = wiele wywołań)
+    def post(self, request, *args, **kwargs):
         try:
-            msg = (
-                EmailMessage.objects
-                .only("id","subject","direction","text_processed")
-                .get(pk=message_id)
-            )
-        except EmailMessage.DoesNotExist:
-            return Response({"detail": "EmailMessage not found."}, status=404)
+            inp = LabelPreviewInput.from_data(request.data, "message_id", batch_field="message_ids")
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
 
-        email_text = (msg.text_processed or "") or (msg.subject or "")
-        if not email_text.strip():
-            return Response({"detail": "Brak treści/tematu do klasyfikacji."}, status=400)
+        if inp.target_ids:
+            msgs_by_id = EmailMessage.objects.only(*self.MESSAGE_FIELDS).in_bulk(inp.target_ids)
+        else:
+            try:
+                msg = EmailMessage.objects.only(*self.MESSAGE_FIELDS).get(pk=inp.target_id)
+            except EmailMessage.DoesNotExist:
+                return Response({"detail": "EmailMessage not found."}, status=404)
 
-        # kinds
-        kinds_qs = self._resolve_kinds(request.data.get("kinds") or [])
-        if not kinds_qs.exists():
-            return Response({"detail": "Brak zdefiniowanych rodzajów (kinds)."}, status=400)
-        kinds_by_id = {k.id: k for k in kinds_qs}
+            if not self._message_text(msg).strip():
+                return Response({"detail": "Brak treści/tematu do klasyfikacji."}, status=400)
+            msgs_by_id = {msg.id: msg}
 
         # dictionary
-        dictionary_code = request.data.get("dictionary_code") or "aiinvite"
-        dictionary_version = request.data.get("dictionary_version") or "v1"
-        dictionary_locale = request.data.get("dictionary_locale") or "pl"
+        dictionary_code = inp.dictionary_code or "aiinvite"
+        dictionary_version = inp.dictionary_version or "v1"
+        dictionary_locale = inp.dictionary_locale or "pl"
         dictionary = self._find_dictionary(dictionary_code, dictionary_version, dictionary_locale)
 
-        # DatasetSample (email)
-        sample, _ = DatasetSample.objects.get_or_create_from_text(
-            email_text,
-            preprocess_version=DEFAULT_PREPROCESS_VERSION,
-            lang="pl",
-            source="email",
-        )
-
-        # cache
-        preds_qs = ModelPrediction.objects.filter(
-            sample=sample,
-            kind_id__in=list(kinds_by_id.keys()),
-            model_name=OPENAI_MODEL_NAME,
-            model_version=OPENAI_MODEL_VERSION,
-        ).select_related("kind","value")
-
-        if hasattr(ModelPrediction, "dictionary_id") and dictionary is not None:
-            preds_qs = preds_qs.filter(dictionary=dictionary)
-
-        preds_by_kind_id = {p.kind_id: p for p in preds_qs}
-        need_kind_ids = [kid for kid in kinds_by_id.keys() if kid not in preds_by_kind_id]
-        if not need_kind_ids:
-            rows = self._serialize_cached_preds(preds_qs)
-            return Response({"labels": self._sort_rows(rows, kinds_qs), "cached": True}, status=200)
+        # kinds (z wybranego zestawu)
+        # jeden SELECT – ta sama mapa służy do sprawdzenia, cache'u i zapisu
+        kinds_by_id = {k.id: k for k in self._resolve_kinds(inp.kinds, dictionary)}
+        if not kinds_by_id:
+            return Response({"detail": "Brak zdefiniowanych rodzajów (kinds)."}, status=400)
 
-        # missing -> OpenAI
-        try:
-            new_rows, saved_any = self._upsert_missing_preds(
-                email_text=email_text,
+        def preview(msg):
+            return self._preview_sample(
+                text=self._message_text(msg),
+                source="email",
                 subject=(msg.subject or None),
                 direction=msg.direction,
-                kinds_qs=kinds_qs,
-                need_kind_ids=need_kind_ids,
                 kinds_by_id=kinds_by_id,
                 dictionary_code=dictionary_code,
                 dictionary_version=dictionary_version,
                 dictionary_locale=dictionary_locale,
-                sample=sample,
                 dictionary=dictionary,
             )
-        except Exception as e:
-            return Response({"detail": f"OpenAI error: {e}"}, status=502)
 
-        # dołącz to, co było w cache
-        cached_rows = self._serialize_cached_preds(preds_qs)
-        all_rows = new_rows + cached_rows
+        if not inp.target_ids:
+            payload, status_code = preview(msgs_by_id[inp.target_id])
+            return Response(payload, status=status_code)
+
+        def batch_item(message_id):
+            msg = msgs_by_id.get(message_id)
+            if msg is None:
+                return {"message_id": message_id, "detail": "EmailMessage not found.", "status": 404}
+            if not self._message_text(msg).strip():
+                return {"message_id": message_id, "detail": "Brak treści/tematu do klasyfikacji.", "status": 400}
+            payload, status_code = preview(msg)
+            if status_code != 200:
+                payload["status"] = status_code
+            return {"message_id": message_id, **payload}
+
+        def batch_item_in_worker(message_id):
+            try:
+                return batch_item(message_id)
+            finally:
+                # wątek puli otwiera własne połączenie z bazą – zamykamy je po zadaniu
+                connections.close_all()
 
-        return Response({"labels": self._sort_rows(all_rows, kinds_qs), "cached": False}, status=200)
+        workers = min(self.BATCH_WORKERS, len(inp.target_ids))
+        if workers <= 1:
+            results = [batch_item(message_id) for message_id in inp.target_ids]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(batch_item_in_worker, inp.target_ids))
+
+        return Response({"results": results}, status=200)
 
 
 # ============ 2) Cały wątek ============
@@ -973,14 +1348,15 @@ class LabelPreviewThreadView(_LabelPreviewBase):
     }
     """
 
-    @transaction.atomic
+    # bez @transaction.atomic: transakcja nie może obejmować wywołania OpenAI (zapis – krótki atomic w _upsert_missing_preds)
     def post(self, request, *args, **kwargs):
-        thread_id = request.data.get("thread_id")
-        if not thread_id:
-            return Response({"detail": "Brak thread_id."}, status=400)
+        try:
+            inp = LabelPreviewInput.from_data(request.data, "thread_id")
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
 
         try:
-            thread = Thread.objects.get(pk=thread_id)
+            thread = Thread.objects.get(pk=inp.target_id)
         except Thread.DoesNotExist:
             return Response({"detail": "Thread not found."}, status=404)
 
@@ -1008,84 +1384,35 @@ class LabelPreviewThreadView(_LabelPreviewBase):
         if not thread_text.strip():
             return Response({"detail": "Brak treści wątku do klasyfikacji."}, status=400)
 
-        # kinds
-        kinds_qs = self._resolve_kinds(request.data.get("kinds") or [])
-        if not kinds_qs.exists():
-            return Response({"detail": "Brak zdefiniowanych rodzajów (kinds)."}, status=400)
-        kinds_by_id = {k.id: k for k in kinds_qs}
-
         # dictionary
-        dictionary_code = request.data.get("dictionary_code") or DICTIONARY_CODE_SET
-        dictionary_version = request.data.get("dictionary_version") or OPENAI_MODEL_VERSION
-        dictionary_locale = request.data.get("dictionary_locale") or DEFAULT_PREPROCESS_LOCALE
+        dictionary_code = inp.dictionary_code or DICTIONARY_CODE_SET
+        dictionary_version = inp.dictionary_version or OPENAI_MODEL_VERSION
+        dictionary_locale = inp.dictionary_locale or DEFAULT_PREPROCESS_LOCALE
         dictionary = self._find_dictionary(dictionary_code, dictionary_version, dictionary_locale)
 
-        # DatasetSample (thread)
-        sample, _ = DatasetSample.objects.get_or_create_from_text(
-            thread_text,
-            preprocess_version=DEFAULT_PREPROCESS_VERSION,
-            lang="pl",
-            source="thread",
-        )
-
-        # cache
-        preds_qs = ModelPrediction.objects.filter(
-            sample=sample,
-            kind_id__in=list(kinds_by_id.keys()),
-            model_name=OPENAI_MODEL_NAME,
-            model_version=OPENAI_MODEL_VERSION,
-        ).select_related("kind","value")
-
-        if hasattr(ModelPrediction, "dictionary_id") and dictionary is not None:
-            preds_qs = preds_qs.filter(dictionary=dictionary)
-
-        preds_by_kind_id = {p.kind_id: p for p in preds_qs}
-        need_kind_ids = [kid for kid in kinds_by_id.keys() if kid not in preds_by_kind_id]
-        if not need_kind_ids:
-            rows = self._serialize_cached_preds(preds_qs)
-            return Response({"labels": self._sort_rows(rows, kinds_qs), "cached": True}, status=200)
+        # kinds (z wybranego zestawu)
+        # jeden SELECT – ta sama mapa służy do sprawdzenia, cache'u i zapisu
+        kinds_by_id = {k.id: k for k in self._resolve_kinds(inp.kinds, dictionary)}
+        if not kinds_by_id:
+            return Response({"detail": "Brak zdefiniowanych rodzajów (kinds)."}, status=400)
 
-        # missing -> OpenAI
         # W wątku nie ma jednego subjecta/direction, więc przekażemy None (LLM widzi kontekst w tekście)
-        try:
-            new_rows, saved_any = self._upsert_missing_preds(
-                email_text=thread_text,
-                subject=None,
-                direction=None,
-                kinds_qs=kinds_qs,
-                need_kind_ids=need_kind_ids,
-                kinds_by_id=kinds_by_id,
-                dictionary_code=dictionary_code,
-                dictionary_version=dictionary_version,
-                dictionary_locale=dictionary_locale,
-                sample=sample,
-                dictionary=dictionary,
-            )
-        except Exception as e:
-            return Response({"detail": f"OpenAI error: {e}"}, status=502)
-
-        # dołącz cache
-        cached_rows = self._serialize_cached_preds(preds_qs)
-        all_rows = new_rows + cached_rows
-
-        return Response({"labels": self._sort_rows(all_rows, kinds_qs), "cached": False}, status=200)
+        payload, status_code = self._preview_sample(
+            text=thread_text,
+            source="thread",
+            subject=None,
+            direction=None,
+            kinds_by_id=kinds_by_id,
+            dictionary_code=dictionary_code,
+            dictionary_version=dictionary_version,
+            dictionary_locale=dictionary_locale,
+            dictionary=dictionary,
+        )
+        return Response(payload, status=status_code)
 
 
 # ---------------------- Pobranie zapisanych Etykiet OpenAI ------------------
 
-# --- te same utilsy co w dataset.models ---
-def _normalize_content(text: str) -> str:
-    if text is None:
-        return ""
-    text = text.replace("\r\n", "\n").replace("\r", "\n")
-    text = re.sub(r"[ \t\f\v]+", " ", text)
-    return text.strip()
-
-
-def _sha256(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
-
-
 def _resolve_dictionary(code: Optional[str], version: Optional[str], locale: Optional[str]) -> Optional[Dictionary]:
     if not code:
         return None
@@ -1176,7 +1503,7 @@ def _latest_preds_for_sample(sample: DatasetSample, dictionary: Optional[Diction
         .filter(sample=sample, model_name=OPENAI_MODEL_NAME, model_version=OPENAI_MODEL_VERSION)
         .select_related("kind", "value")
     )
-    if hasattr(ModelPrediction, "dictionary_id") and dictionary is not None:
+    if _HAS_DICT_FK and dictionary is not None:
         qs = qs.filter(dictionary=dictionary)
 
     qs = qs.order_by("kind_id", "-created_at", "-id").distinct("kind_id")
@@ -1,6 +1,8 @@
 # dataset/admin.py
 from django import forms
 from django.contrib import admin
+from django.core.cache import cache
+from django.db.models import F, Func, IntegerField, OuterRef, QuerySet, Subquery
 from django.utils.translation import gettext_lazy as _
 
 from .models import (
@@ -17,6 +19,24 @@ from .models import (
 #   FORMS
 # ===========================
 
+def _values_for_kind(form: forms.ModelForm, dictionary_id) -> QuerySet:
+    """
+    Queryset wartości dla rodzaju z formularza (POST) albo z instancji – po samym kind_id,
+    bez pobierania obiektu DictionaryKind (w inline'ach to było zapytanie na każdy wiersz).
+    """
+    kind_id = form.data.get(form.add_prefix("kind"))
+    if not (isinstance(kind_id, str) and kind_id.isdigit()):
+        kind_id = form.instance.kind_id if form.instance.pk else None
+    if not kind_id:
+        return DictionaryValue.objects.none()
+
+    # select_related: etykieta wartości (__str__) pokazuje kod rodzaju i zestawu
+    qs = DictionaryValue.objects.filter(kind_id=kind_id, is_active=True).select_related("kind__dictionary")
+    if dictionary_id:
+        qs = qs.filter(kind__dictionary_id=dictionary_id)
+    return qs
+
+
 class LabelFinalAdminForm(forms.ModelForm):
     """
     Ogranicza 'value' do wartości pasujących do wybranego 'kind'
@@ -30,22 +50,7 @@ class LabelFinalAdminForm(forms.ModelForm):
         dictionary_id = kwargs.pop("dictionary_id", None)
         super().__init__(*args, **kwargs)
 
-        kind = None
-        if "kind" in self.data:
-            try:
-                kind = DictionaryKind.objects.get(pk=self.data.get("kind"))
-            except DictionaryKind.DoesNotExist:
-                kind = None
-        if not kind and self.instance and self.instance.pk:
-            kind = self.instance.kind
-
-        qs = DictionaryValue.objects.none()
-        if kind:
-            qs = DictionaryValue.objects.filter(kind=kind, is_active=True)
-            if dictionary_id:
-                qs = qs.filter(kind__dictionary_id=dictionary_id)
-
-        self.fields["value"].queryset = qs
+        self.fields["value"].queryset = _values_for_kind(self, dictionary_id)
         self.fields["value"].help_text = _(
             "Wartości filtrowane automatycznie po wybranym rodzaju (i opcjonalnie po zestawie)."
         )
@@ -64,22 +69,7 @@ class AnnotationAdminForm(forms.ModelForm):
         dictionary_id = kwargs.pop("dictionary_id", None)
         super().__init__(*args, **kwargs)
 
-        kind = None
-        if "kind" in self.data:
-            try:
-                kind = DictionaryKind.objects.get(pk=self.data.get("kind"))
-            except DictionaryKind.DoesNotExist:
-                kind = None
-        if not kind and self.instance and self.instance.pk:
-            kind = self.instance.kind
-
-        qs = DictionaryValue.objects.none()
-        if kind:
-            qs = DictionaryValue.objects.filter(kind=kind, is_active=True)
-            if dictionary_id:
-                qs = qs.filter(kind__dictionary_id=dictionary_id)
-
-        self.fields["value"].queryset = qs
+        self.fields["value"].queryset = _values_for_kind(self, dictionary_id)
         self.fields["value"].help_text = _(
             "Wartości filtrowane automatycznie po wybranym rodzaju (i opcjonalnie po zestawie)."
         )
@@ -143,36 +133,54 @@ class ModelPredictionInline(admin.TabularInline):
 #   LIST FILTERS
 # ===========================
 
-class DictionaryFilter(admin.SimpleListFilter):
-    title = _("zestaw etykiet")
-    parameter_name = "dictionary_id"
+# Opcje filtrów słownikowych: w cache, z kluczem = znacznik zawartości słowników (zmienia się przy każdym
+# zapisie Dictionary/DictionaryKind/DictionaryValue), więc bez zapytania na każde wyświetlenie listy.
+LOOKUPS_CACHE_TIMEOUT = 300  # s
 
-    def lookups(self, request, model_admin):
+
+def _dictionary_lookups() -> list[tuple[int, str]]:
+    def load():
         qs = Dictionary.objects.order_by("-is_active", "code", "version", "locale").values(
             "id", "code", "version", "locale", "name"
         )
         return [(r["id"], f'{r["name"]} ({r["code"]} {r["version"]}/{r["locale"]})') for r in qs]
 
+    return cache.get_or_set(f"admin:dictionary_lookups:{Dictionary.content_stamp()}", load, LOOKUPS_CACHE_TIMEOUT)
+
+
+def _kind_code_lookups() -> list[tuple[str, str]]:
+    def load():
+        # ten sam kod może wystąpić w kilku zestawach – jedna opcja na kod
+        codes = DictionaryKind.objects.order_by("code").values_list("code", flat=True).distinct()
+        return [(code, code) for code in codes]
+
+    return cache.get_or_set(f"admin:kind_code_lookups:{Dictionary.content_stamp()}", load, LOOKUPS_CACHE_TIMEOUT)
+
+
+class DictionaryFilter(admin.SimpleListFilter):
+    title = _("zestaw etykiet")
+    parameter_name = "dictionary_id"
+
+    def lookups(self, request, model_admin):
+        return _dictionary_lookups()
+
+    # model -> pole filtrowane po ID zestawu
+    FIELD_BY_MODEL = {
+        DictionaryValue: "kind__dictionary_id",
+        LabelFinal: "kind__dictionary_id",
+        Annotation: "kind__dictionary_id",
+        DictionaryKind: "dictionary_id",
+        Dictionary: "id",
+        # predykcja nie ma własnego 'dictionary' obowiązkowo, ale filtr po kind.dictionary ma sens
+        ModelPrediction: "kind__dictionary_id",
+    }
+
     def queryset(self, request, queryset):
         val = self.value()
-        if not val:
+        field = self.FIELD_BY_MODEL.get(queryset.model)
+        if not val or not field:
             return queryset
-
-        model = queryset.model
-        if model is DictionaryValue:
-            return queryset.filter(kind__dictionary_id=val)
-        if model is LabelFinal:
-            return queryset.filter(kind__dictionary_id=val)
-        if model is Annotation:
-            return queryset.filter(kind__dictionary_id=val)
-        if model is DictionaryKind:
-            return queryset.filter(dictionary_id=val)
-        if model is Dictionary:
-            return queryset.filter(id=val)
-        if model is ModelPrediction:
-            # predykcja nie ma własnego 'dictionary' obowiązkowo, ale filtr po kind.dictionary ma sens
-            return queryset.filter(kind__dictionary_id=val)
-        return queryset
+        return queryset.filter(**{field: val})
 
 
 class DictionaryKindCodeFilter(admin.SimpleListFilter):
@@ -180,25 +188,23 @@ class DictionaryKindCodeFilter(admin.SimpleListFilter):
     parameter_name = "kind_code"
 
     def lookups(self, request, model_admin):
-        return [(k["code"], k["code"]) for k in DictionaryKind.objects.values("code").order_by("code")]
+        return _kind_code_lookups()
+
+    # model -> pole filtrowane po kodzie rodzaju
+    FIELD_BY_MODEL = {
+        DictionaryValue: "kind__code",
+        LabelFinal: "kind__code",
+        Annotation: "kind__code",
+        DictionaryKind: "code",
+        ModelPrediction: "kind__code",
+    }
 
     def queryset(self, request, queryset):
         code = self.value()
-        if not code:
+        field = self.FIELD_BY_MODEL.get(queryset.model)
+        if not code or not field:
             return queryset
-
-        model = queryset.model
-        if model is DictionaryValue:
-            return queryset.filter(kind__code=code)
-        if model is LabelFinal:
-            return queryset.filter(kind__code=code)
-        if model is Annotation:
-            return queryset.filter(kind__code=code)
-        if model is DictionaryKind:
-            return queryset.filter(code=code)
-        if model is ModelPrediction:
-            return queryset.filter(kind__code=code)
-        return queryset
+        return queryset.filter(**{field: code})
 
 
 class SampleSourceFilter(admin.SimpleListFilter):
@@ -206,8 +212,7 @@ class SampleSourceFilter(admin.SimpleListFilter):
     parameter_name = "source"
 
     def lookups(self, request, model_admin):
-        sources = DatasetSample.objects.values_list("source", flat=True).distinct().order_by("source")
-        return [(s, s) for s in sources if s]
+        return [(s, s) for s in DatasetSample.distinct_sources() if s]
 
     def queryset(self, request, queryset):
         val = self.value()
@@ -227,9 +232,19 @@ class SampleSourceFilter(admin.SimpleListFilter):
 def short(text: str, n: int = 80) -> str:
     if not text:
         return ""
-    text = text.strip().split("\n", 1)[0]
+    text = text.strip().partition("\n")[0]
     return (text[: n - 1] + "…") if len(text) > n else text
 
+def count_subquery(qs: QuerySet) -> Subquery:
+    """
+    Skorelowany COUNT(*) jako adnotacja listy admina – jedno zapytanie na stronę zamiast .count() na wiersz.
+    COUNT bez GROUP BY (Func, nie Aggregate): zawsze jeden wiersz, także 0; bez JOIN-ów mnożących wiersze.
+    """
+    return Subquery(
+        qs.order_by().annotate(c=Func(F("id"), function="COUNT")).values("c")[:1],
+        output_field=IntegerField(),
+    )
+
 # ===========================
 #   ADMINS
 # ===========================
@@ -242,13 +257,20 @@ class DictionaryAdmin(admin.ModelAdmin):
     ordering = ("-is_active", "code", "version", "locale")
     inlines = [DictionaryKindInline]
 
-    @admin.display(description=_("liczba rodzajów"))
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.annotate(
+            kinds_total=count_subquery(DictionaryKind.objects.filter(dictionary=OuterRef("pk"))),
+            values_total=count_subquery(DictionaryValue.objects.filter(kind__dictionary=OuterRef("pk"))),
+        )
+
+    @admin.display(description=_("liczba rodzajów"), ordering="kinds_total")
     def kinds_count(self, obj: Dictionary) -> int:
-        return DictionaryKind.objects.filter(dictionary=obj).count()
+        return obj.kinds_total
 
-    @admin.display(description=_("liczba wartości"))
+    @admin.display(description=_("liczba wartości"), ordering="values_total")
     def values_count(self, obj: Dictionary) -> int:
-        return DictionaryValue.objects.filter(kind__dictionary=obj).count()
+        return obj.values_total
 
 
 @admin.register(DictionaryKind)
@@ -260,9 +282,15 @@ class DictionaryKindAdmin(admin.ModelAdmin):
     inlines = [DictionaryValueInline]
     autocomplete_fields = ("dictionary",)
 
-    @admin.display(description=_("liczba wartości"))
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.annotate(
+            values_total=count_subquery(DictionaryValue.objects.filter(kind=OuterRef("pk"))),
+        )
+
+    @admin.display(description=_("liczba wartości"), ordering="values_total")
     def values_count(self, obj: DictionaryKind) -> int:
-        return obj.values.count()
+        return obj.values_total
 
 
 @admin.register(DictionaryValue)
@@ -277,6 +305,10 @@ class DictionaryValueAdmin(admin.ModelAdmin):
     ordering = ("kind__dictionary__code", "kind__dictionary__version", "kind__name", "sort_order", "name")
     autocomplete_fields = ("kind",)
 
+    def get_queryset(self, request):
+        # __str__ wartości sięga do kind i kind.dictionary – też w wynikach autocomplete
+        return super().get_queryset(request).select_related("kind__dictionary")
+
     @admin.display(description=_("zestaw"))
     def dictionary_display(self, obj: DictionaryValue):
         d = obj.kind.dictionary
@@ -307,17 +339,25 @@ class DatasetSampleAdmin(admin.ModelAdmin):
     def content_short(self, obj: DatasetSample):
         return short(obj.content, 120)
 
-    @admin.display(description=_("finalne etykiety"))
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.annotate(
+            labels_final_total=count_subquery(LabelFinal.objects.filter(sample=OuterRef("pk"))),
+            annotations_total=count_subquery(Annotation.objects.filter(sample=OuterRef("pk"))),
+            predictions_total=count_subquery(ModelPrediction.objects.filter(sample=OuterRef("pk"))),
+        )
+
+    @admin.display(description=_("finalne etykiety"), ordering="labels_final_total")
     def labels_final_count(self, obj: DatasetSample):
-        return obj.labels_final.count()
+        return obj.labels_final_total
 
-    @admin.display(description=_("adnotacje"))
+    @admin.display(description=_("adnotacje"), ordering="annotations_total")
     def annotations_count(self, obj: DatasetSample):
-        return obj.annotations.count()
+        return obj.annotations_total
 
-    @admin.display(description=_("predykcje"))
+    @admin.display(description=_("predykcje"), ordering="predictions_total")
     def predictions_count(self, obj: DatasetSample):
-        return obj.predictions.count()
+        return obj.predictions_total
 
 
 @admin.register(LabelFinal)
@@ -355,7 +395,8 @@ class LabelFinalAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related("kind", "value", "kind__dictionary", "sample")
+        # próbka w kolumnie listy to tylko __str__ (title_cached) – bez wczytywania pełnej treści
+        return qs.select_related("kind__dictionary", "value__kind__dictionary", "sample").defer("sample__content")
 
     @admin.display(description=_("zestaw"))
     def dictionary_display(self, obj: LabelFinal):
@@ -410,7 +451,8 @@ class AnnotationAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related("kind", "value", "kind__dictionary", "sample", "annotator")
+        # próbka w kolumnie listy to tylko __str__ (title_cached) – bez wczytywania pełnej treści
+        return qs.select_related("kind__dictionary", "value__kind__dictionary", "sample", "annotator").defer("sample__content")
 
     @admin.display(description=_("zestaw"))
     def dictionary_display(self, obj: Annotation):
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class DatasetConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "dataset"
+
+    def ready(self):
+        from . import signals
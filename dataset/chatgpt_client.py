@@ -1,10 +1,8 @@
 # chatgpt_client.py
 from __future__ import annotations
-from functools import lru_cache
-from typing import Any, Dict, Optional, Literal
-import json
+from typing import Any, Dict, Iterable, Optional, Literal
+import orjson
 
-from django.db.models import QuerySet
 from openai import OpenAI
 
 from dataset.models import Dictionary, DictionaryKind, DictionaryValue
@@ -14,9 +12,7 @@ from dataset.models import Dictionary, DictionaryKind, DictionaryValue
 #   KATALOG SŁOWNIKÓW Z BAZY
 # ==============================
 
-def _codes_and_ids(qs: QuerySet) -> tuple[list[str], dict[str, int]]:
-    rows = list(qs.values("id", "code", "description"))
-
+def _codes_and_ids(rows: list[dict]) -> tuple[list[str], dict[str, int], dict[str, str]]:
     codes = sorted(r["code"] for r in rows)
     code_to_id = {}
     dictionary_kind_desc = {}
@@ -44,43 +40,83 @@ def _dictionary_filter(
     return obj.id if obj else None
 
 
-@lru_cache(maxsize=16)
+# katalogi per (znacznik zawartości słowników, code, version, locale); zmiana znacznika unieważnia wszystkie
+_ENUMS_CACHE: dict[tuple, Dict[str, Any]] = {}
+_ENUMS_CACHE_MAX = 16
+
+
 def load_value_enums(
     *, dictionary_code: Optional[str] = None, version: Optional[str] = None, locale: Optional[str] = None
 ) -> Dict[str, Any]:
     """
-    Zwraca dynamiczny katalog rodzajów i wartości.
+    Zwraca dynamiczny katalog rodzajów i wartości (z pamięci procesu, dopóki słowniki się nie zmienią).
     Jeśli podasz dictionary_code/version/locale — ograniczy wartości do danego zestawu.
     Struktura:
     {
-      "kinds": {"style": kind_id, ...},
+      "kinds": {"style": {"id": kind_id, "description": ...}, ...},
+      "kind_ids": {"style": kind_id, ...},          # płaska mapa kod -> id (to_label_rows)
       "values_by_kind": {
         "style": {"codes": [...], "code_to_id": {...}},
         ...
       },
-      "dictionary_id": 123 or None
+      "dictionary_id": 123 or None,
+      "catalog_text": "...",                       # build_kind_catalog_text(enums)
+      "tool_schema": {...}                         # build_tool_schema_dynamic(enums)
     }
     """
-    kinds_qs = DictionaryKind.objects.all().values("id", "code", "description")
-    kinds = {row["code"]: {"id": row["id"], "description": row["description"]} for row in kinds_qs}
-
+    key = (Dictionary.content_stamp(), dictionary_code, version, locale)
+    enums = _ENUMS_CACHE.get(key)
+    if enums is None:
+        if len(_ENUMS_CACHE) >= _ENUMS_CACHE_MAX or any(k[0] != key[0] for k in _ENUMS_CACHE):
+            _ENUMS_CACHE.clear()
+        enums = _load_value_enums(dictionary_code=dictionary_code, version=version, locale=locale)
+        # prompt i schemat narzędzia są czystą funkcją katalogu – budowane raz, razem z nim
+        enums["catalog_text"] = build_kind_catalog_text(enums)
+        enums["tool_schema"] = build_tool_schema_dynamic(enums)
+        _ENUMS_CACHE[key] = enums
+    return enums
+
+
+def _load_value_enums(
+    *, dictionary_code: Optional[str], version: Optional[str], locale: Optional[str]
+) -> Dict[str, Any]:
     dictionary_id = _dictionary_filter(
         dictionary_code=dictionary_code, version=version, locale=locale
     )
 
+    # kod rodzaju jest unikalny w obrębie zestawu – przy wskazanym zestawie tylko jego rodzaje
+    kinds_qs = DictionaryKind.objects.all()
+    if dictionary_id is not None:
+        kinds_qs = kinds_qs.filter(dictionary_id=dictionary_id)
+    kinds = {
+        row["code"]: {"id": row["id"], "description": row["description"]}
+        for row in kinds_qs.values("id", "code", "description")
+    }
+
+    # wszystkie aktywne wartości jednym zapytaniem, grupowane po rodzaju w Pythonie
+    # (kolejność w obrębie rodzaju = domyślne sortowanie DictionaryValue, jak przy zapytaniu per rodzaj)
+    qs = DictionaryValue.objects.filter(kind_id__in=[k["id"] for k in kinds.values()], is_active=True)
+    if dictionary_id is not None:
+        qs = qs.filter(kind__dictionary_id=dictionary_id)
+    rows_by_kind: dict[int, list[dict]] = {}
+    for row in qs.values("id", "code", "description", "kind_id"):
+        rows_by_kind.setdefault(row["kind_id"], []).append(row)
+
     values_by_kind: dict[str, dict[str, Any]] = {}
-    for code, kind_id in kinds.items():
-        qs = DictionaryValue.objects.filter(kind_id=kind_id["id"], is_active=True)
-        if dictionary_id is not None:
-            qs = qs.filter(kind__dictionary_id=dictionary_id)
-        codes, code_to_id, value_descriptions = _codes_and_ids(qs)
+    for code, kind in kinds.items():
+        codes, code_to_id, value_descriptions = _codes_and_ids(rows_by_kind.get(kind["id"], []))
         values_by_kind[code] = {
             "codes": codes, 
             "code_to_id": code_to_id,
             "value_descriptions": value_descriptions
         }
 
-    return {"kinds": kinds, "values_by_kind": values_by_kind, "dictionary_id": dictionary_id}
+    return {
+        "kinds": kinds,
+        "kind_ids": {code: kind["id"] for code, kind in kinds.items()},
+        "values_by_kind": values_by_kind,
+        "dictionary_id": dictionary_id,
+    }
 
 
 def build_kind_catalog_text(enums: Dict[str, Any]) -> str:
@@ -138,10 +174,49 @@ def build_tool_schema_dynamic(enums: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+_PROMPTS_PER_ENUMS_MAX = 64
+
+
+def _prompt_for_kinds(enums: Dict[str, Any], kind_codes: Optional[Iterable[str]]) -> tuple[str, Dict[str, Any]]:
+    """
+    (catalog_text, tool_schema) ograniczone do wskazanych rodzajów – model klasyfikuje tylko brakujące.
+    Pełny katalog -> wersje zbudowane razem z enums; podzbiory zapamiętywane w enums (ten sam cykl życia).
+    """
+    full = (enums["catalog_text"], enums["tool_schema"])
+    if kind_codes is None:
+        return full
+    subset = frozenset(kind_codes).intersection(enums["kinds"])
+    if not subset or len(subset) == len(enums["kinds"]):
+        return full
+
+    prompts = enums.setdefault("prompts_by_kinds", {})
+    prompt = prompts.get(subset)
+    if prompt is None:
+        part = {
+            "kinds": {c: k for c, k in enums["kinds"].items() if c in subset},
+            "values_by_kind": {c: v for c, v in enums["values_by_kind"].items() if c in subset},
+        }
+        prompt = (build_kind_catalog_text(part), build_tool_schema_dynamic(part))
+        if len(prompts) < _PROMPTS_PER_ENUMS_MAX:
+            prompts[subset] = prompt
+    return prompt
+
+
 # ==============================
 #   WYWOŁANIE OPENAI
 # ==============================
 
+# Klient per api_key współdzielony między wywołaniami (pula połączeń / keep-alive zamiast nowego TLS co request).
+_OPENAI_CLIENTS: dict[str, OpenAI] = {}
+
+
+def _openai_client(api_key: str) -> OpenAI:
+    client = _OPENAI_CLIENTS.get(api_key)
+    if client is None:
+        client = _OPENAI_CLIENTS.setdefault(api_key, OpenAI(api_key=api_key, max_retries=2))
+    return client
+
+
 def label_email_with_openai(
     *,
     email_text: str,
@@ -152,16 +227,19 @@ def label_email_with_openai(
     dictionary_code: Optional[str],
     dictionary_version: Optional[str],
     dictionary_locale: Optional[str],
+    kind_codes: Optional[Iterable[str]] = None,
 ) -> tuple[Dict[str, Any], Dict[str, Any]]:
     """
     Zwraca: (raw_args, enums)
       raw_args = {"labels":[{"kind","value","snippet"?}, ...]}
       enums    = wynik load_value_enums(...) (zawiera mapy kod->id)
+    kind_codes – opcjonalnie tylko te rodzaje w katalogu i schemacie (np. brakujące w cache predykcji).
     """
     enums = load_value_enums(
         dictionary_code=dictionary_code, version=dictionary_version, locale=dictionary_locale
     )
-    client = OpenAI(api_key=openai_api_key)
+    catalog_text, tool_schema = _prompt_for_kinds(enums, kind_codes)
+    client = _openai_client(openai_api_key)
 
     sys_msg = (
         "Jesteś klasyfikatorem e-maili. ZAWSZE zwróć rezultat wyłącznie "
@@ -173,7 +251,7 @@ def label_email_with_openai(
     if direction:
         parts.append(f"Kierunek: {direction}")
 
-    parts.append(build_kind_catalog_text(enums))  # informacja o dostępnych kodach per rodzaj
+    parts.append(catalog_text)  # informacja o dostępnych kodach per rodzaj
     parts.append("Wybieraj wartości po 'code'. Jeśli to możliwe, zwróć także 'snippet' (fragment, który uzasadnia etykietę).")
     parts.append(f"Treść e-maila:\n{email_text}")
     user_msg = "\n".join(parts)
@@ -184,7 +262,7 @@ def label_email_with_openai(
             {"role": "system", "content": sys_msg},
             {"role": "user", "content": user_msg},
         ],
-        tools=[build_tool_schema_dynamic(enums)],
+        tools=[tool_schema],
         tool_choice={"type": "function", "function": {"name": "set_labels"}},
     )
 
@@ -194,7 +272,7 @@ def label_email_with_openai(
     if not getattr(choice, "tool_calls", None):
         raise RuntimeError("Model nie zwrócił wywołania funkcji (tool_calls).")
 
-    args = json.loads(choice.tool_calls[0].function.arguments)
+    args = orjson.loads(choice.tool_calls[0].function.arguments)  # str; błąd parsowania to nadal ValueError
     return args, enums
 
 
@@ -209,7 +287,8 @@ def to_label_rows(raw: Dict[str, Any], enums: Dict[str, Any]) -> list[Dict[str,
              "global_rationale":"..."}
     Zwraca listę: [{"kind_id":..., "value_id":..., "snippet":"..."}, ...]
     """
-    kinds = enums["kinds"]
+    # mapy z katalogu (budowane raz razem z enums) jako zmienne lokalne pętli
+    kind_ids = enums["kind_ids"]
     vals = enums["values_by_kind"]
 
     rows: list[Dict[str, Any]] = []
@@ -220,7 +299,8 @@ def to_label_rows(raw: Dict[str, Any], enums: Dict[str, Any]) -> list[Dict[str,
         value_code = item.get("value")
         snippet = item.get("snippet", "") or ""
 
-        if not kind_code or kind_code not in kinds:
+        kind_id = kind_ids.get(kind_code) if kind_code else None
+        if kind_id is None:
             raise ValueError(f"Nieznany rodzaj etykiety: {kind_code!r}")
 
         try:
@@ -229,7 +309,7 @@ def to_label_rows(raw: Dict[str, Any], enums: Dict[str, Any]) -> list[Dict[str,
             raise ValueError(f"Nieznany kod wartości '{value_code}' dla rodzaju '{kind_code}'.")
 
         rows.append({
-            "kind_id": kinds[kind_code].get('id'),
+            "kind_id": kind_id,
             "value_id": value_id,
             "snippet": snippet,
         })
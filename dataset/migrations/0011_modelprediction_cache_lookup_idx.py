@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-15 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataset', '0010_alter_annotation_options_alter_datasetsample_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='modelprediction',
+            index=models.Index(fields=['sample', 'model_name', 'model_version', 'kind'], name='mp_cache_lookup_idx'),
+        ),
+    ]
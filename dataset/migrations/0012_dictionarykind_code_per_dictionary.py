@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-15 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataset', '0011_modelprediction_cache_lookup_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dictionarykind',
+            name='code',
+            field=models.SlugField(max_length=64, verbose_name='kod rodzaju'),
+        ),
+        migrations.AddConstraint(
+            model_name='dictionarykind',
+            constraint=models.UniqueConstraint(fields=('dictionary', 'code'), name='uniq_kind_dict_code'),
+        ),
+    ]
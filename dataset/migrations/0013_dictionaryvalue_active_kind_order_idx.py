@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-15 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataset', '0012_dictionarykind_code_per_dictionary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dictionaryvalue',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['kind', 'sort_order', 'name'], name='didx_value_active_kind_order'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-15 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataset', '0013_dictionaryvalue_active_kind_order_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='datasetsample',
+            name='content_hash',
+            field=models.CharField(editable=False, help_text='Skrót SHA-256 znormalizowanej treści; służy do deduplikacji i linkowania.', max_length=64, verbose_name='skrót treści (sha256)'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-15 10:07
+
+from django.db import migrations, models
+
+
+def fill_title_cached(apps, schema_editor):
+    # tytuł z pierwszej linii treści dla istniejących próbek (jak _sample_title w modelu)
+    DatasetSample = apps.get_model("dataset", "DatasetSample")
+    batch = []
+    for sample in DatasetSample.objects.only("id", "content").iterator(chunk_size=2000):
+        title = sample.content.split("\n", 1)[0]
+        sample.title_cached = title[:57] + "..." if len(title) > 60 else title
+        batch.append(sample)
+        if len(batch) >= 2000:
+            DatasetSample.objects.bulk_update(batch, ["title_cached"])
+            batch = []
+    if batch:
+        DatasetSample.objects.bulk_update(batch, ["title_cached"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dataset', '0014_datasetsample_drop_content_hash_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasetsample',
+            name='title_cached',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Pierwsza linia treści (skrócona do 60 znaków); używana w reprezentacji tekstowej próbki.', max_length=64, verbose_name='tytuł'),
+        ),
+        migrations.RunPython(fill_title_cached, migrations.RunPython.noop),
+    ]
@@ -3,7 +3,9 @@ from __future__ import annotations
 
 import hashlib
 import re
+import time
 
+from django.core.cache import cache
 from django.db import models
 from django.utils import timezone
 
@@ -38,6 +40,22 @@ class Dictionary(models.Model):
     def __str__(self) -> str:
         return f"{self.name} ({self.code} {self.version}/{self.locale})"
 
+    CONTENT_STAMP_KEY = "dictionary:content_stamp"
+
+    @classmethod
+    def content_stamp(cls) -> int:
+        """
+        Znacznik zawartości słowników (zestawy/rodzaje/wartości) – zmienia się przy każdym zapisie/usunięciu
+        (sygnały w signals.py). Klucz dla pamięci podręcznych wyliczanych z tych tabel.
+        Trzymany we wspólnym cache (CACHES w settings), więc zmiana w jednym workerze unieważnia wszystkie.
+        Brak wpisu w cache (np. eviction) -> nowy znacznik, więc stare wyniki nigdy nie wracają.
+        """
+        return cache.get_or_set(cls.CONTENT_STAMP_KEY, time.time_ns, None)
+
+    @classmethod
+    def bump_content_stamp(cls) -> None:
+        cache.set(cls.CONTENT_STAMP_KEY, time.time_ns(), None)
+
 
 # ==========================
 #   RODZAJE ETYKIET
@@ -48,7 +66,7 @@ class DictionaryKind(models.Model):
         Dictionary, on_delete=models.CASCADE, related_name="kinds",
         verbose_name="zestaw"
     )
-    code = models.SlugField(max_length=64, unique=True, verbose_name="kod rodzaju")
+    code = models.SlugField(max_length=64, verbose_name="kod rodzaju")
     name = models.CharField(max_length=160, verbose_name="nazwa rodzaju")
     is_active = models.BooleanField(default=True, verbose_name="aktywna")
     description = models.TextField(blank=True, default="", verbose_name="opis rodzaju")
@@ -57,11 +75,32 @@ class DictionaryKind(models.Model):
         verbose_name = "Rodzaj etykiety"
         verbose_name_plural = "Rodzaje etykiet"
         ordering = ["name"]
+        # kod unikalny w obrębie zestawu (każda wersja słownika ma własne rodzaje)
+        constraints = [
+            models.UniqueConstraint(fields=["dictionary", "code"], name="uniq_kind_dict_code"),
+        ]
         indexes = [models.Index(fields=["code"])]
 
     def __str__(self) -> str:
         return self.name
 
+    ORDER_CACHE_TIMEOUT = 3600  # s
+
+    @classmethod
+    def order_map(cls) -> dict[int, int]:
+        """
+        id rodzaju -> pozycja wg (name, code) – kolejność etykiet w odpowiedziach.
+        Klucz zawiera content_stamp słownika, więc zmiana rodzajów daje nowy wpis.
+        """
+        return cache.get_or_set(
+            f"dictionary_kind:order:{Dictionary.content_stamp()}",
+            lambda: {
+                kid: idx
+                for idx, kid in enumerate(cls.objects.order_by("name", "code").values_list("id", flat=True), start=1)
+            },
+            cls.ORDER_CACHE_TIMEOUT,
+        )
+
 
 # ==========================
 #   WARTOŚCI (w zestawie/rodzaju)
@@ -86,6 +125,11 @@ class DictionaryValue(models.Model):
         ordering = ["kind__name", "sort_order", "name"]
         indexes = [
             models.Index(fields=["kind", "sort_order"]),
+            # aktywne wartości rodzaju w kolejności wyświetlania (katalog LLM, drzewo słownika, mapy value_code)
+            models.Index(
+                fields=["kind", "sort_order", "name"], condition=models.Q(is_active=True),
+                name="didx_value_active_kind_order",
+            ),
         ]
 
     def __str__(self) -> str:
@@ -97,6 +141,9 @@ class DictionaryValue(models.Model):
 # ==========================
 
 # ---------------- utils ----------------
+_INLINE_WS_RE = re.compile(r"[ \t\f\v]+")  # spacje/taby w linii (bez \n)
+
+
 def _normalize_content(text: str) -> str:
     """
     Normalizacja treści na potrzeby stabilnego skrótu:
@@ -108,21 +155,27 @@ def _normalize_content(text: str) -> str:
         return ""
     
     text = text.replace("\r\n", "\n").replace("\r", "\n")
-    text = re.sub(r"[ \t\f\v]+", " ", text)
+    text = _INLINE_WS_RE.sub(" ", text)
     return text.strip()
 
 def _sha256(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    # skrót do deduplikacji, nie zabezpieczenie – dozwolona ścieżka OpenSSL poza trybem FIPS
+    return hashlib.sha256(text.encode("utf-8"), usedforsecurity=False).hexdigest()
+
+
+def _sample_title(text: str) -> str:
+    # pierwsza linia treści, skrócona do 60 znaków – tytuł próbki w __str__
+    title = (text or "").split("\n", 1)[0]
+    return title[:57] + "..." if len(title) > 60 else title
 
 
 # --------------- Dataset ---------------
 
 class DatasetSampleQuerySet(models.QuerySet):
-    pass
-
-class DatasetSampleManager(models.Manager):
-    def get_queryset(self):
-        return DatasetSampleQuerySet(self.model, using=self._db)
+    """
+    Metody deduplikacji jako metody querysetu – dostępne przez DatasetSample.objects
+    (menedżer z as_manager()) i na querysetach pochodnych.
+    """
 
     def get_or_create_from_text(
         self,
@@ -138,13 +191,60 @@ class DatasetSampleManager(models.Manager):
         """
         norm = _normalize_content(text or "")
         h = _sha256(norm)
-        obj, created = self.get_or_create(
-            content_hash=h,
-            preprocess_version=preprocess_version,
-            source=source,
-            defaults={"content": norm, "lang": lang or ""},
-        )
-        return obj, created
+        lookup = {"content_hash": h, "preprocess_version": preprocess_version, "source": source}
+        # istniejąca próbka: bez kolumny content (treść jest znana z wejścia; doczyta się przy dostępie)
+        try:
+            return self.defer("content").get(**lookup), False
+        except self.model.DoesNotExist:
+            pass
+        # brak: get_or_create obsługuje równoległe utworzenie (IntegrityError -> ponowny odczyt)
+        return self.get_or_create(**lookup, defaults={"content": norm, "lang": lang or ""})
+
+    def get_or_create_many_from_texts(self, entries, *, source: str = "generic"):
+        """
+        Wersja wsadowa get_or_create_from_text.
+        entries: lista (text, preprocess_version, lang). Zwraca listę próbek w kolejności wejścia.
+        Jedno zapytanie o istniejące + bulk_create brakujących (ignore_conflicts) + doczytanie utworzonych.
+        """
+        keys = []
+        to_create = {}
+        for text, preprocess_version, lang in entries:
+            norm = _normalize_content(text or "")
+            key = (_sha256(norm), preprocess_version)
+            keys.append(key)
+            # pierwsze wystąpienie decyduje o content/lang (jak przy kolejnych get_or_create)
+            to_create.setdefault(key, (norm, lang or ""))
+
+        def fetch(wanted):
+            qs = self.filter(
+                source=source,
+                content_hash__in={h for h, _ in wanted},
+                preprocess_version__in={v for _, v in wanted},
+            )
+            return {(o.content_hash, o.preprocess_version): o for o in qs}
+
+        found = fetch(to_create.keys())
+        missing = [key for key in to_create if key not in found]
+        if missing:
+            # bulk_create pomija save(), więc content_hash i title_cached ustawiamy sami
+            # (z tej samej normalizacji)
+            self.bulk_create(
+                [
+                    self.model(
+                        content=to_create[key][0],
+                        content_hash=key[0],
+                        title_cached=_sample_title(to_create[key][0]),
+                        preprocess_version=key[1],
+                        lang=to_create[key][1],
+                        source=source,
+                    )
+                    for key in missing
+                ],
+                ignore_conflicts=True,
+            )
+            found.update(fetch(missing))
+
+        return [found[key] for key in keys]
 
 class DatasetSample(models.Model):
     """
@@ -159,11 +259,19 @@ class DatasetSample(models.Model):
         verbose_name="treść (kanoniczna)",
         help_text="Znormalizowana treść próbki używana do trenowania i etykietowania."
     )
+    # bez osobnego indeksu: wyszukiwanie po skrócie obsługuje indeks ograniczenia unikalności
+    # (content_hash, preprocess_version, source), w którym content_hash jest pierwszą kolumną
     content_hash = models.CharField(
-        max_length=64, db_index=True, editable=False,
+        max_length=64, editable=False,
         verbose_name="skrót treści (sha256)",
         help_text="Skrót SHA-256 znormalizowanej treści; służy do deduplikacji i linkowania."
     )
+    # liczony w save() razem ze skrótem – listy i autocomplete nie muszą wczytywać całej treści
+    title_cached = models.CharField(
+        max_length=64, editable=False, blank=True, default="",
+        verbose_name="tytuł",
+        help_text="Pierwsza linia treści (skrócona do 60 znaków); używana w reprezentacji tekstowej próbki."
+    )
     preprocess_version = models.CharField(
         max_length=16, default="v1", db_index=True,
         verbose_name="wersja preprocessingu",
@@ -185,7 +293,7 @@ class DatasetSample(models.Model):
         help_text="Znacznik czasu utworzenia próbki."
     )
 
-    objects = DatasetSampleManager()
+    objects = DatasetSampleQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Próbka danych"
@@ -203,15 +311,48 @@ class DatasetSample(models.Model):
         ]
         ordering = ["-created_at", "-id"]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # skrót z bazy odpowiada wczytanej treści – save() bez zmiany treści nie liczy go ponownie
+        instance._hashed_content = instance.__dict__.get("content")
+        return instance
+
     def save(self, *args, **kwargs):
-        norm = _normalize_content(self.content or "")
-        self.content_hash = _sha256(norm)
+        update_fields = kwargs.get("update_fields")
+        writes_content = (
+            "content" in update_fields if update_fields is not None
+            else "content" not in self.get_deferred_fields()
+        )
+        if writes_content:
+            if self.content is not getattr(self, "_hashed_content", None) or not self.content_hash:
+                self.content_hash = _sha256(_normalize_content(self.content or ""))
+                self.title_cached = _sample_title(self.content)
+                self._hashed_content = self.content
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "content_hash", "title_cached"}
         super().save(*args, **kwargs)
 
+    SOURCES_CACHE_KEY = "dataset_sample:sources"
+    SOURCES_CACHE_TIMEOUT = 600  # s
+
+    @classmethod
+    def distinct_sources(cls) -> list[str]:
+        """
+        Lista źródeł próbek (DISTINCT po indeksie na source) – wynik w cache.
+        Próbka z nowym źródłem czyści wpis (sygnał post_save w signals.py); bulk_create – po TTL.
+        """
+        return cache.get_or_set(
+            cls.SOURCES_CACHE_KEY,
+            lambda: list(cls.objects.order_by("source").values_list("source", flat=True).distinct()),
+            cls.SOURCES_CACHE_TIMEOUT,
+        )
+
     def __str__(self):
-        title = (self.content or "").split("\n", 1)[0]
-        if len(title) > 60:
-            title = title[:57] + "..."
+        title = self.title_cached
+        if not title and "content" not in self.get_deferred_fields():
+            # próbka jeszcze niezapisana (save() nie wyliczył tytułu)
+            title = _sample_title(self.content)
         return f"#{self.pk} [{self.source}/{self.lang or 'unk'}/{self.preprocess_version}] {title}"
 
 
@@ -380,9 +521,59 @@ class ModelPrediction(models.Model):
         verbose_name_plural = "Predykcje modeli"
         indexes = [
             models.Index(fields=["kind", "model_name", "model_version"]),
+            # odczyt cache predykcji: sample + model/wersja (+ kind)
+            models.Index(fields=["sample", "model_name", "model_version", "kind"], name="mp_cache_lookup_idx"),
         ]
         ordering = ["-created_at", "-id"]
 
     def __str__(self):
         dict_info = f"/dict#{self.dictionary_id}" if self.dictionary_id else ""
         return f"[PRED] {self.model_name}:{self.model_version}{dict_info} kind#{self.kind_id}→value#{self.value_id} @ sample#{self.sample_id}"
+
+    PREVIEW_CACHE_TIMEOUT = 300  # s
+
+    @staticmethod
+    def preview_cache_key(sample_id: int, model_name: str, model_version: str, dictionary_id: int | None) -> str:
+        raw = f"{sample_id}|{model_name}|{model_version}|{dictionary_id or ''}"
+        return "mp_rows:" + hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    @classmethod
+    def preview_rows(cls, sample_id: int, model_name: str, model_version: str,
+                     dictionary_id: int | None = None) -> list[dict]:
+        """
+        Predykcje próbki dla modelu (i słownika, jeśli podany) jako wiersze podglądu etykiet
+        {kind_id, kind_code, value_id, value_code, snippet} – wynik w cache (get_or_set).
+        Zapis/usunięcie predykcji czyści wpis (sygnały w signals.py).
+        """
+        def load():
+            qs = cls.objects.filter(sample_id=sample_id, model_name=model_name, model_version=model_version)
+            if dictionary_id:
+                qs = qs.filter(dictionary_id=dictionary_id)
+            return [
+                {
+                    "kind_id": p.kind_id,
+                    "kind_code": p.kind.code,
+                    "value_id": p.value_id,
+                    "value_code": p.value.code,
+                    "snippet": p.evidence_snippet or "",
+                }
+                # tylko kolumny wiersza podglądu (+ kolumny FK dla select_related)
+                for p in qs.select_related("kind", "value").only(
+                    "kind", "value", "evidence_snippet", "kind__code", "value__code",
+                )
+            ]
+
+        return cache.get_or_set(
+            cls.preview_cache_key(sample_id, model_name, model_version, dictionary_id),
+            load,
+            cls.PREVIEW_CACHE_TIMEOUT,
+        )
+
+    @classmethod
+    def forget_preview_rows(cls, sample_id: int, model_name: str, model_version: str,
+                            dictionary_id: int | None) -> None:
+        # wpis dla konkretnego słownika oraz wpis "bez słownika" (obejmuje predykcje wszystkich słowników)
+        cache.delete_many([
+            cls.preview_cache_key(sample_id, model_name, model_version, d_id)
+            for d_id in {dictionary_id or None, None}
+        ])
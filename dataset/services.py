@@ -1,5 +1,9 @@
 # dataset/services.py
 from typing import Dict, List
+
+from django.conf import settings
+
+from .chatgpt_client import label_email_with_openai
 from .models import DictionaryKind
 
 def run_openai_classification(
@@ -12,16 +16,33 @@ def run_openai_classification(
 ) -> Dict[int, List[dict]]:
     """
     Zwraca: { kind.id: [ {"value_code": str, "proba": float, "evidence_snippet": str}, ... ] }
-    Tutaj podłącz właściwe wywołanie OpenAI (prompt per kind lub multi-task).
+    Jedno wywołanie OpenAI dla wszystkich rodzajów naraz (katalog i schemat narzędzia zawężone
+    do `kinds`), wynik rozdzielany per kind.id. Model nie zwraca prawdopodobieństwa – proba = 0.0
+    (jak przy zapisie predykcji w widokach).
     """
-    # TODO: implementacja prawdziwego calla do OpenAI
-    # Poniżej przykładowa „fałszywka” pod strukturę odpowiedzi:
-    results: Dict[int, List[dict]] = {}
-    for k in kinds:
-        # przykładowy dummy wynik
-        results[k.id] = [{
-            "value_code": "joy" if k.code == "emotion" else "TY",
-            "proba": 0.9,
-            "evidence_snippet": text[:140]
-        }][:topk]
-    return results
+    kind_ids = {k.code: k.id for k in kinds}
+    results: Dict[int, List[dict]] = {kid: [] for kid in kind_ids.values()}
+    if not kind_ids or topk < 1:
+        # nic do sklasyfikowania / do zwrócenia – bez wywołania API
+        return results
+
+    raw_args, _ = label_email_with_openai(
+        email_text=text,
+        model_openai=model_version,
+        openai_api_key=settings.OPENAI_API_KEY,
+        dictionary_code=settings.DICTIONARY_CODE_SET,
+        dictionary_version=settings.DEFAULT_PREPROCESS_VERSION,
+        dictionary_locale=lang or settings.DEFAULT_PREPROCESS_LOCALE,
+        kind_codes=kind_ids.keys(),
+    )
+
+    for item in raw_args.get("labels", []):
+        kid = kind_ids.get(item.get("kind"))
+        if kid is None or not item.get("value"):
+            continue
+        results[kid].append({
+            "value_code": item["value"],
+            "proba": 0.0,
+            "evidence_snippet": (item.get("snippet") or "").strip(),
+        })
+    return {kid: preds[:topk] for kid, preds in results.items()}
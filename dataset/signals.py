@@ -0,0 +1,36 @@
+# dataset/signals.py
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Dictionary, DictionaryKind, DictionaryValue, DatasetSample, ModelPrediction
+
+
+# ---- ModelPrediction: cache wierszy podglądu etykiet --------------------------
+@receiver(post_save, sender=ModelPrediction)
+@receiver(post_delete, sender=ModelPrediction)
+def model_prediction_preview_cache(sender, instance: ModelPrediction, **kwargs):
+    ModelPrediction.forget_preview_rows(
+        instance.sample_id, instance.model_name, instance.model_version, instance.dictionary_id,
+    )
+
+
+# ---- Słowniki: znacznik zawartości (cache katalogu dla LLM) --------------------
+@receiver(post_save, sender=Dictionary)
+@receiver(post_delete, sender=Dictionary)
+@receiver(post_save, sender=DictionaryKind)
+@receiver(post_delete, sender=DictionaryKind)
+@receiver(post_save, sender=DictionaryValue)
+@receiver(post_delete, sender=DictionaryValue)
+def dictionary_content_changed(sender, **kwargs):
+    Dictionary.bump_content_stamp()
+
+
+# ---- DatasetSample: cache listy źródeł (filtr admina) ----------------------------
+@receiver(post_save, sender=DatasetSample)
+def dataset_sample_sources_cache(sender, instance: DatasetSample, created, **kwargs):
+    # nowe źródło -> lista w cache jest niepełna
+    if created:
+        sources = cache.get(DatasetSample.SOURCES_CACHE_KEY)
+        if sources is not None and instance.source not in sources:
+            cache.delete(DatasetSample.SOURCES_CACHE_KEY)
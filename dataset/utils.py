@@ -1,5 +1,39 @@
-from typing import List
-from dataset.models import Dictionary, DictionaryKind, DictionaryValue
+from itertools import chain, groupby
+from operator import itemgetter
+from typing import Iterator
+
+from dataset.models import Dictionary, DictionaryValue
+
+
+ITERATOR_CHUNK_SIZE = 2000
+
+
+def render_dictionary_tree_iter(dictionary: Dictionary) -> Iterator[str]:
+    """
+    Linie drzewa zestawu (Dictionary -> Kinds -> Values) jako generator – wartości czytane
+    strumieniowo (iterator), więc pamięć nie rośnie z rozmiarem słownika; nadaje się też
+    bezpośrednio do StreamingHttpResponse.
+    """
+    yield f"Zestaw: {dictionary.name} ({dictionary.code} {dictionary.version}/{dictionary.locale})"
+    yield f"Opis: {dictionary.description.strip()}"
+    yield ""
+
+    # aktywne wartości zestawu razem z danymi rodzaju – jedno zapytanie (JOIN), krotki zamiast modeli;
+    # rodzaje bez aktywnych wartości nie pojawiają się w wyniku
+    rows = (
+        DictionaryValue.objects.filter(kind__dictionary=dictionary, is_active=True)
+        .order_by("kind__name", "kind_id", "sort_order", "name")
+        .values_list("kind_id", "kind__code", "kind__name", "kind__description", "code", "name", "description")
+    )
+
+    for _, kind_rows in groupby(rows.iterator(chunk_size=ITERATOR_CHUNK_SIZE), key=itemgetter(0)):
+        first = next(kind_rows)
+        _, kind_code, kind_name, kind_description = first[:4]
+        yield f"├─ Rodzaj: {kind_name} ({kind_code})"
+        yield f"│  Opis: {kind_description.strip()}"
+        for _, _, _, _, code, name, description in chain((first,), kind_rows):
+            yield f"│    • {name} [{code}] — {description.strip()}"
+        yield ""
 
 
 def render_dictionary_tree(dictionary: Dictionary) -> str:
@@ -7,29 +41,4 @@ def render_dictionary_tree(dictionary: Dictionary) -> str:
     Zwraca czytelny string przedstawiający zestaw słowników w formie drzewa:
     Dictionary -> Kinds -> Values.
     """
-    lines: List[str] = []
-    lines.append(f"Zestaw: {dictionary.name} ({dictionary.code} {dictionary.version}/{dictionary.locale})")
-    lines.append(f"Opis: {dictionary.description.strip()}")
-    lines.append("")
-
-    # pobieramy wszystkie rodzaje + ich wartości
-    kinds = (
-        DictionaryKind.objects.all()
-        .order_by("name")
-        .prefetch_related("values")
-    )
-
-    for kind in kinds:
-        values = (
-            DictionaryValue.objects.filter(kind=kind, is_active=True)
-            .order_by("sort_order", "name")
-        )
-        if not values.exists():
-            continue
-        lines.append(f"├─ Rodzaj: {kind.name} ({kind.code})")
-        lines.append(f"│  Opis: {kind.description.strip()}")
-        for val in values:
-            lines.append(f"│    • {val.name} [{val.code}] — {val.description.strip()}")
-        lines.append("")
-
-    return "\n".join(lines)
+    return "\n".join(render_dictionary_tree_iter(dictionary))
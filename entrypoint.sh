@@ -14,6 +14,9 @@ fi
 echo "Uruchamiam migracje"
 python manage.py migrate --noinput
 
+echo "Tworzę tabelę cache (tylko CACHE_URL=dbcache://…; dla Redisa bez efektu)"
+python manage.py createcachetable
+
 echo "Zbieram statyczne pliki"
 python manage.py collectstatic --noinput
 
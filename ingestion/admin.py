@@ -1,22 +1,46 @@
+import orjson
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
 from django.db.models import Count, Sum, OuterRef, Subquery, IntegerField, Value
-from django.utils.html import strip_tags
+from django.utils.functional import cached_property
 from django.utils.text import Truncator
 from django.db.models.functions import Coalesce
 
 from .models import Person, Thread, EmailMessage, MessageRecipient,\
     PartnerStat
+from .services import assign_threads_from_hints
 
 
 # -----------------------------
 # Wspólne helpery
 # -----------------------------
-def _snippet(text: str, *, length: int = 120) -> str:
-    if not text:
-        return ""
-    # Usuwamy HTML i skracamy
-    clean = strip_tags(text)
-    return Truncator(clean).chars(length)
+class FastCountPaginator(Paginator):
+    """
+    Paginator dla dużych tabel: bez filtrów/wyszukiwania liczbę wierszy bierze z estymaty
+    planera PostgreSQL (pg_class.reltuples) zamiast SELECT COUNT(*) po całej tabeli.
+    Przy filtrach, innych bazach i małych tabelach – zwykły COUNT.
+    """
+
+    # poniżej tej estymaty dokładny COUNT jest tani (i estymata bywa nieaktualna po świeżym imporcie)
+    ESTIMATE_MIN_ROWS = 10_000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        query = getattr(qs, "query", None)
+        if query is not None and not query.where:
+            connection = connections[qs.db]
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                        [qs.model._meta.db_table],
+                    )
+                    row = cursor.fetchone()
+                if row and row[0] >= self.ESTIMATE_MIN_ROWS:
+                    return row[0]
+        return super().count
 
 
 # -----------------------------
@@ -47,6 +71,19 @@ class HasThreadFilter(admin.SimpleListFilter):
             return queryset.filter(thread__isnull=True)
         return queryset
 
+class PersonDomainFilter(admin.SimpleListFilter):
+    title = "domena"
+    parameter_name = "domain"
+
+    def lookups(self, request, model_admin):
+        # lista domen z cache (Person.distinct_domains) zamiast DISTINCT przy każdym widoku
+        return [(d, d) for d in Person.distinct_domains()]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(domain=self.value())
+        return queryset
+
 # -----------------------------
 # Person
 # -----------------------------
@@ -54,7 +91,7 @@ class HasThreadFilter(admin.SimpleListFilter):
 class PersonAdmin(admin.ModelAdmin):
     list_display = ("email", "display_name", "domain", "sent_count", "received_count")
     search_fields = ("email", "display_name", "domain")
-    list_filter = ("domain",)
+    list_filter = (PersonDomainFilter,)
     ordering = ("email",)
     readonly_fields = ()
     fieldsets = (
@@ -128,6 +165,12 @@ class EmailMessageAdmin(admin.ModelAdmin):
         "has_thread",
         "recipients_count",
     )
+    # FK z list_display w jednym zapytaniu listy (nullowalne FK nie są dociągane
+    # przez domyślne select_related() changelisty)
+    list_select_related = ("from_person", "delivered_to")
+    # największa tabela: bez filtrów liczba z estymaty, bez dodatkowego COUNT całości
+    paginator = FastCountPaginator
+    show_full_result_count = False
     list_filter = (
         "direction",
         "user_processed",
@@ -218,7 +261,8 @@ class EmailMessageAdmin(admin.ModelAdmin):
 
     @admin.display(description="wątek?")
     def has_thread(self, obj: EmailMessage):
-        return bool(obj.thread)
+        # sama kolumna FK – bez JOIN-a i bez budowania obiektu Thread
+        return obj.thread_id is not None
     has_thread.boolean = True  # ikonka ✔/✖
 
     def get_queryset(self, request):
@@ -231,23 +275,22 @@ class EmailMessageAdmin(admin.ModelAdmin):
 
     @admin.display(description="podgląd (plain)")
     def preview_text_plain(self, obj: EmailMessage):
-        return _snippet(obj.text_plain, length=300)
+        return obj.preview_plain
 
     @admin.display(description="podgląd (html→tekst)")
     def preview_text_html_parsed(self, obj: EmailMessage):
-        return _snippet(obj.text_html_parsed, length=300)
+        return obj.preview_html_parsed
 
     @admin.display(description="Formatowany tekst")
     def preview_text_processed(self, obj: EmailMessage):
-        return _snippet(obj.text_processed, length=300)
+        return obj.preview_processed
 
     @admin.display(description="surowy JSON")
     def raw_payload_pretty(self, obj: EmailMessage):
         if not obj.raw_payload:
             return ""
-        # ładne formatowanie
-        import json as _json
-        return _json.dumps(obj.raw_payload, ensure_ascii=False, indent=2)
+        # ładne formatowanie (orjson: znaki spoza ASCII bez escapowania, jak ensure_ascii=False)
+        return orjson.dumps(obj.raw_payload, option=orjson.OPT_INDENT_2).decode()
 
     # ---- Akcje ----
     actions = ("assign_threads_from_hint",)
@@ -260,22 +303,8 @@ class EmailMessageAdmin(admin.ModelAdmin):
         - kopiuje subject_norm ze skrótu tematu,
         - przypisuje do EmailMessage.thread.
         """
-        created = 0
-        updated = 0
-        for msg in queryset:
-            hint = (msg.thread_hint or "").strip()
-            if not hint:
-                continue
-            thread, was_created = Thread.objects.get_or_create(
-                thread_key=hint,
-                defaults={"subject_norm": (msg.subject or "").strip()},
-            )
-            if was_created:
-                created += 1
-            if msg.thread_id != thread.id:
-                msg.thread = thread
-                msg.save(update_fields=["thread"])
-                updated += 1
+        result = assign_threads_from_hints(queryset)
+        created, updated = result["created"], result["updated"]
         self.message_user(
             request,
             f"Utworzono wątków: {created}, zaktualizowano przypisań: {updated}",
@@ -289,6 +318,7 @@ class EmailMessageAdmin(admin.ModelAdmin):
 @admin.register(MessageRecipient)
 class MessageRecipientAdmin(admin.ModelAdmin):
     list_display = ("id", "message", "person", "kind")
+    list_select_related = ("message", "person")
     list_filter = ("kind",)
     search_fields = (
         "message__subject",
@@ -309,6 +339,9 @@ class PartnerStatAdmin(admin.ModelAdmin):
         "msg_count", "msg_processed_count",
         "last_message_at",
     )
+    list_select_related = ("a", "b")  # a_email / b_email bez zapytania na wiersz
+    paginator = FastCountPaginator
+    show_full_result_count = False
     list_filter = ("last_message_at",)
     search_fields = ("a__email", "b__email")
     ordering = ("-msg_count",)
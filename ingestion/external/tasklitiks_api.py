@@ -1,9 +1,9 @@
-import base64, hashlib
+import base64, hashlib, os
 import requests, json
 
 
-login = "jacek.rakoczy"
-password = "Jacek2021"
+login = os.environ["TASKLYTICS_LOGIN"]
+password = os.environ["TASKLYTICS_PASSWORD"]
 sha = hashlib.sha256(password.encode()).hexdigest()
 user_key = base64.b64encode(f"{login}:{sha}".encode()).decode()
 
@@ -12,9 +12,12 @@ headers = {
     "Accept": "application/json"
 }
 
+# jedna sesja (keep-alive) – kolejne zapytania bez ponownego zestawiania połączenia TLS
+session = requests.Session()
+
 url = "https://api.tasklytics.eu/app/legacy/login/v3?scope=PRODUCTION"
 # UWAGA: curl -d '...' wysyła to jako zwykły tekst, więc w requests musisz dać data=..., nie json=...
-resp = requests.post(url, headers=headers, data=user_key)
+resp = session.post(url, headers=headers, data=user_key)
 resp_json = resp.json()
 token = resp_json[0]['cloudToken']
 
@@ -32,7 +35,7 @@ headers = {
     "Authorization": token
 }
 
-resp = requests.get(url, headers=headers, params=params)
+resp = session.get(url, headers=headers, params=params)
 data = resp.json()
 url = "https://api.tasklytics.eu/app/email/message/details"
 for item in data['default']['data']:
@@ -40,6 +43,6 @@ for item in data['default']['data']:
         "mailBoxId": 1177807,
         "messageId": item['Id']
     }
-    resp = requests.get(url, headers=headers, params=params)
+    resp = session.get(url, headers=headers, params=params)
     data = resp.json()
     print(data)
\ No newline at end of file
@@ -1,10 +1,11 @@
 # assign_threads.py
 import re
+from itertools import islice
 from typing import Optional, Sequence
 
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from django.db.models import Q, QuerySet, Exists, OuterRef
+from django.db.models import Q, QuerySet
 from django.utils.text import slugify
 
 from ingestion.models import EmailMessage, Thread, Person
@@ -17,23 +18,18 @@ _SUBJECT_PREFIXES = (
 )
 
 
+# prefiksy (dowolnie powtórzone, np. "Re: Re: Fwd:") razem z separatorami po nich – jednym dopasowaniem
+_SUBJECT_PREFIX_RE = re.compile(
+    r"^(?:(?:%s)[ \t\-:\[\]]*)+" % "|".join(re.escape(p) for p in _SUBJECT_PREFIXES),
+    re.IGNORECASE,
+)
+
+
 def normalize_subject(subject: str) -> str:
     """Usuwa typowe prefiksy odpowiedzi/przekazań i normalizuje temat."""
     if not subject:
         return ""
-    s = subject.strip()
-    s_low = s.lower()
-    changed = True
-    # wycinamy powtarzające się prefiksy (np. Re: Re: Fwd:)
-    while changed and s_low:
-        changed = False
-        for p in _SUBJECT_PREFIXES:
-            if s_low.startswith(p):
-                s = s[len(p):].lstrip(" \t-:[]")
-                s_low = s.lower()
-                changed = True
-                break
-    return s
+    return _SUBJECT_PREFIX_RE.sub("", subject.strip(), count=1)
 
 
 def extract_references(ref_header: str) -> Sequence[str]:
@@ -46,97 +42,124 @@ def extract_references(ref_header: str) -> Sequence[str]:
     return [t.strip("<> ,;\t") for t in ref_header.split() if t.strip("<> ,;\t")]
 
 
-def find_parent_thread(msg: EmailMessage) -> Optional[Thread]:
-    """Próbuje znaleźć wątek po In-Reply-To lub References."""
-    # 1) Po In-Reply-To (najbardziej wiarygodne)
-    if msg.in_reply_to_header:
-        parent = (
+# message_id_header -> (id wiadomości, thread_id, thread_key); przy powtórzonym Message-ID
+# wygrywa wiadomość o największym id (jak order_by("-id") przy dopasowaniu po References)
+ParentMap = dict[str, tuple[int, int, str]]
+
+
+def _parent_headers(msg: EmailMessage) -> list[str]:
+    headers = [msg.in_reply_to_header] if msg.in_reply_to_header else []
+    if msg.references_header:
+        headers.extend(extract_references(msg.references_header))
+    return headers
+
+
+def remember_parent(parents: ParentMap, header: str, msg_id: int, thread_id: int, thread_key: str) -> None:
+    """Dopisuje wiadomość z wątkiem do mapy rodziców (z zachowaniem reguły największego id)."""
+    known = parents.get(header)
+    if known is None or msg_id > known[0]:
+        parents[header] = (msg_id, thread_id, thread_key)
+
+
+def fetch_parents_bulk(msgs: Sequence[EmailMessage]) -> ParentMap:
+    """
+    Jedno zapytanie o wszystkich potencjalnych rodziców paczki wiadomości
+    (In-Reply-To + References) – tylko tych, które mają już wątek.
+    """
+    headers = {h for msg in msgs for h in _parent_headers(msg)}
+    parents: ParentMap = {}
+    if headers:
+        rows = (
             EmailMessage.objects
-            .filter(message_id_header=msg.in_reply_to_header)
-            .select_related("thread")
-            .first()
+            .filter(message_id_header__in=headers, thread__isnull=False)
+            .values_list("message_id_header", "id", "thread_id", "thread__thread_key")
         )
-        if parent and parent.thread:
-            return parent.thread
+        for header, msg_id, thread_id, thread_key in rows:
+            remember_parent(parents, header, msg_id, thread_id, thread_key)
+    return parents
 
-    # 2) Po References (pierwsza dopasowana wiadomość z wątkiem)
+
+def find_parent_thread(msg: EmailMessage, parents: ParentMap) -> Optional[tuple[int, str]]:
+    """
+    Próbuje znaleźć wątek po In-Reply-To lub References w mapie z fetch_parents_bulk.
+    Zwraca (thread_id, thread_key) albo None.
+    """
+    # 1) Po In-Reply-To (najbardziej wiarygodne)
+    if msg.in_reply_to_header and msg.in_reply_to_header in parents:
+        return parents[msg.in_reply_to_header][1:]
+
+    # 2) Po References (najnowsza dopasowana wiadomość z wątkiem)
     if msg.references_header:
-        refs = extract_references(msg.references_header)
-        if refs:
-            parent = (
-                EmailMessage.objects
-                .filter(message_id_header__in=refs, thread__isnull=False)
-                .select_related("thread")
-                .order_by("-id")
-                .first()
-            )
-            if parent:
-                return parent.thread
+        found = [parents[ref] for ref in extract_references(msg.references_header) if ref in parents]
+        if found:
+            return max(found)[1:]
 
     return None
 
 
-def get_or_create_subject_thread(msg: EmailMessage) -> Thread:
-    """Fallback do tematu: tworzy/znajduje Thread po znormalizowanym temacie."""
+def get_or_create_subject_thread(msg: EmailMessage) -> tuple[Thread, bool]:
+    """
+    Fallback do tematu: tworzy/znajduje Thread po znormalizowanym temacie.
+    Zwraca (thread, created) – jak get_or_create.
+    """
     subject_norm = normalize_subject(msg.subject or "")
     if subject_norm:
         thread_key = f"subj:{slugify(subject_norm)[:200]}"
-        thread, _ = Thread.objects.get_or_create(
+        return Thread.objects.get_or_create(
             thread_key=thread_key,
             defaults={"subject_norm": subject_norm[:500]},
         )
-        return thread
     # Ostateczny fallback – stabilny klucz na bazie Message-ID / external_message_id / pk
-    key = f"msgid:{msg.message_id_header or msg.external_message_id or msg.pk}"
-    thread, _ = Thread.objects.get_or_create(thread_key=key)
+    key = f"msgid:{msg.message_id_header or msg.external_message_id or msg.id}"
+    thread, created = Thread.objects.get_or_create(thread_key=key)
     if not thread.subject_norm and msg.subject:
         thread.subject_norm = normalize_subject(msg.subject)[:500]
         thread.save(update_fields=["subject_norm"])
-    return thread
+    return thread, created
 
 
-def assign_thread_for_message(msg: EmailMessage, allow_subject_fallback: bool = True) -> Thread:
+def resolve_thread_for(
+    msg: EmailMessage,
+    parents: ParentMap,
+    allow_subject_fallback: bool = True,
+) -> tuple[int, str, bool]:
     """
-    Przypisuje (albo tworzy) Thread dla pojedynczej wiadomości.
-    Zwraca docelowy Thread (nic nie robi jeśli thread już istnieje).
+    Wyznacza (albo tworzy) Thread dla pojedynczej wiadomości – bez zapisu wiadomości
+    (przypisanie zapisuje wywołujący, wsadowo).
+    Zwraca (thread_id, thread_key, czy utworzono nowy wątek); dla wiadomości z wątkiem – jej wątek.
     """
     if msg.thread_id:
-        return msg.thread  # już przypisane
+        return msg.thread_id, "", False  # już przypisane
 
     # 1) Po nagłówkach
-    parent_thread = find_parent_thread(msg)
-    if parent_thread:
-        msg.thread = parent_thread
-        msg.save(update_fields=["thread"])
-        return parent_thread
-
-    # 2) Fallback po temacie (opcjonalny)
-    if allow_subject_fallback:
-        thread = get_or_create_subject_thread(msg)
-        msg.thread = thread
-        msg.save(update_fields=["thread"])
-        return thread
-
-    # 3) Brak fallbacku — tworzymy własny wątek po Message-ID
-    thread = get_or_create_subject_thread(msg)
-    msg.thread = thread
-    msg.save(update_fields=["thread"])
-    return thread
+    parent = find_parent_thread(msg, parents)
+    if parent:
+        return *parent, False
+
+    # 2) Brak rodzica: zawsze get_or_create_subject_thread – dopasowanie/utworzenie wątku po
+    #    znormalizowanym temacie, a dla pustego tematu po kluczu Message-ID. allow_subject_fallback
+    #    tego nie wyłącza (jak dotąd); wpływa tylko na opis w --dry-run (_dry_run_action)
+    thread, created = get_or_create_subject_thread(msg)
+    return thread.id, thread.thread_key, created
 
 
 # ===== Filtry osób (A i/lub B) =====
 
-def _exists_recipient(person_id: int):
+def _recipient_message_ids(person_id: int) -> QuerySet:
     from ingestion.models import MessageRecipient  # lokalny import, by uniknąć cykli
-    return Exists(
-        MessageRecipient.objects.filter(message=OuterRef("pk"), person_id=person_id)
-    )
+    # podzapytanie nieskorelowane: w warunku OR baza liczy je raz (indeks po person) i sprawdza
+    # wiadomości w tablicy haszującej – zamiast skorelowanego EXISTS wykonywanego dla każdego wiersza
+    return MessageRecipient.objects.filter(person_id=person_id).values("message_id")
 
 def q_involves_person(person_id: int) -> Q:
     """
     Czy wiadomość angażuje daną osobę (nadawca, adresat, delivered_to)?
     """
-    return Q(from_person_id=person_id) | Q(delivered_to_id=person_id) | _exists_recipient(person_id)
+    return (
+        Q(from_person_id=person_id)
+        | Q(delivered_to_id=person_id)
+        | Q(pk__in=_recipient_message_ids(person_id))
+    )
 
 def q_between(person_a_id: int, person_b_id: int) -> Q:
     """
@@ -199,6 +222,14 @@ class Command(BaseCommand):
             help="Wymagaj współwystąpienia obu osób (--person i --with-person) w tej samej wiadomości.",
         )
 
+    CHUNK_SIZE = 1000  # wiadomości na paczkę: jedno zapytanie o rodziców, jedno bulk_update
+    # kolumny czytane przy wyznaczaniu wątku (daty służą tylko do filtrowania w WHERE)
+    MESSAGE_FIELDS = (
+        "id", "thread_id", "subject",
+        "message_id_header", "external_message_id",
+        "in_reply_to_header", "references_header",
+    )
+
     def _base_queryset(
         self,
         process_all: bool,
@@ -224,12 +255,10 @@ class Command(BaseCommand):
         elif with_person_id:
             qs = qs.filter(q_involves_person(with_person_id))
 
-        return qs.select_related("thread").only(
-            "id", "thread_id", "subject",
-            "message_id_header", "external_message_id",
-            "in_reply_to_header", "references_header",
-            "sent_at", "received_at",
-        ).distinct()
+        # bez distinct(): filtry to kolumny wiadomości i nieskorelowane pk IN (SELECT message_id ...)
+        # po tabeli adresatów (bez JOIN), więc wiersze się nie powielają, a DISTINCT po wszystkich
+        # kolumnach wymuszałby sortowanie (także w count())
+        return qs.only(*self.MESSAGE_FIELDS)
 
     def handle(self, *args, **opts):
         process_all = bool(opts.get("all"))
@@ -257,7 +286,8 @@ class Command(BaseCommand):
         p_b = _check_person(with_person_id) if with_person_id else None
 
         qs = self._base_queryset(process_all, since, person_id, with_person_id, only_between)
-        total = qs.count() if limit == 0 else min(limit, qs.count())
+        # z limitem liczymy tylko do limitu (COUNT z podzapytania z LIMIT), nie całą tabelę
+        total = qs[:limit].count() if limit else qs.count()
 
         if total == 0:
             self.stdout.write(self.style.WARNING("Brak wiadomości do przetworzenia."))
@@ -284,45 +314,61 @@ class Command(BaseCommand):
         processed = 0
         created_threads = 0
         reused_threads = 0
+        if limit:
+            qs = qs[:limit]
+        if dry_run:
+            # podgląd nic nie zapisuje – krotki z nazwanymi polami zamiast instancji modelu
+            qs = qs.values_list(*self.MESSAGE_FIELDS, named=True)
+        messages = qs.iterator(chunk_size=self.CHUNK_SIZE)
+
+        while chunk := list(islice(messages, self.CHUNK_SIZE)):
+            parents = fetch_parents_bulk(chunk)
+            pending: list[EmailMessage] = []  # wiadomości z nowym wątkiem, do bulk_update
+
+            for msg in chunk:
+                if dry_run:
+                    self.stdout.write(f"[DRY] msg#{msg.id} {self._dry_run_action(msg, parents, allow_subject_fallback)}")
+                    processed += 1
+                    continue
+
+                thread_id, thread_key, created = resolve_thread_for(msg, parents, allow_subject_fallback)
+                if msg.thread_id != thread_id:
+                    msg.thread_id = thread_id
+                    pending.append(msg)
+                    # odpowiedzi z tej samej paczki widzą nowy wątek jeszcze przed zapisem
+                    if msg.message_id_header:
+                        remember_parent(parents, msg.message_id_header, msg.id, thread_id, thread_key)
 
-        for msg in qs.iterator(chunk_size=1000):
-            if limit and processed >= limit:
-                break
-
-            before_thread_id = msg.thread_id
-
-            if dry_run:
-                simulated = find_parent_thread(msg)
-                if simulated:
-                    action = f"-> thread(parent) {simulated.thread_key}"
-                elif allow_subject_fallback:
-                    subj = normalize_subject(msg.subject or "")
-                    key = f"subj:{slugify(subj)[:200]}" if subj else f"msgid:{msg.message_id_header or msg.external_message_id or msg.pk}"
-                    action = f"-> thread(fallback) {key}"
-                else:
-                    key = f"msgid:{msg.message_id_header or msg.external_message_id or msg.pk}"
-                    action = f"-> thread(msgid) {key}"
-                self.stdout.write(f"[DRY] msg#{msg.id} {action}")
                 processed += 1
-                continue
-
-            with transaction.atomic():
-                thread = assign_thread_for_message(msg, allow_subject_fallback=allow_subject_fallback)
-
-            processed += 1
-            if before_thread_id:
-                reused_threads += 1
-            else:
-                if thread and thread.messages.count() <= 1:
+                if created:
                     created_threads += 1
                 else:
                     reused_threads += 1
 
-            # >>>>> NOWE: licznik postępu <<<<<
-            if processed % 500 == 0 or processed == total:
-                self.stdout.write(self.style.NOTICE(f"Postęp: {processed}/{total}"))
+                # >>>>> NOWE: licznik postępu <<<<<
+                if processed % 500 == 0 or processed == total:
+                    self.stdout.write(self.style.NOTICE(f"Postęp: {processed}/{total}"))
+
+            if pending:
+                with transaction.atomic():
+                    EmailMessage.objects.bulk_update(pending, ["thread"])
 
         self.stdout.write("")
         self.stdout.write(self.style.SUCCESS(f"Gotowe. Przetworzono: {processed}"))
         self.stdout.write(self.style.SUCCESS(f"Użyte/istniejące wątki: {reused_threads}"))
         self.stdout.write(self.style.SUCCESS(f"Nowe wątki: {created_threads}"))
+
+    @staticmethod
+    def _dry_run_action(msg: EmailMessage, parents: ParentMap, allow_subject_fallback: bool) -> str:
+        """Opis planowanego przypisania (tryb --dry-run; nic nie zapisuje)."""
+        simulated = find_parent_thread(msg, parents)
+        if simulated:
+            action = f"-> thread(parent) {simulated[1]}"
+        elif allow_subject_fallback:
+            subj = normalize_subject(msg.subject or "")
+            key = f"subj:{slugify(subj)[:200]}" if subj else f"msgid:{msg.message_id_header or msg.external_message_id or msg.id}"
+            action = f"-> thread(fallback) {key}"
+        else:
+            key = f"msgid:{msg.message_id_header or msg.external_message_id or msg.id}"
+            action = f"-> thread(msgid) {key}"
+        return action
@@ -20,6 +20,7 @@ class Command(BaseCommand):
         parser.add_argument("--page-from", type=int, default=1, help="Strona początkowa (1-indeksowana)")
         parser.add_argument("--page-to", type=int, default=None, help="Strona końcowa (włącznie); jeśli brak → do końca")
         parser.add_argument("--sleep", type=float, default=1.0, help="Odstęp (sekundy) między stronami, by nie zajechać API")
+        parser.add_argument("--workers", type=int, default=8, help="Liczba równoległych pobrań szczegółów w obrębie strony (1 = sekwencyjnie)")
 
     def handle(self, *args, **opts):
         base_url     = opts["base_url"]
@@ -31,6 +32,7 @@ class Command(BaseCommand):
         page_from    = opts["page_from"]
         page_to      = opts.get("page_to")
         pause        = max(0.0, float(opts["sleep"]))
+        workers      = max(1, opts["workers"])
 
         client = TasklyticsClient(base_url=base_url, login=login, password=password)
         client.authenticate()
@@ -61,10 +63,9 @@ class Command(BaseCommand):
                     ))
                     break
 
-                # 2) Pobierz szczegóły
+                # 2) Pobierz szczegóły (równolegle, kolejność jak w ids)
                 page_items = []
-                for mid in ids:
-                    details = client.fetch_details(mailbox_id, mid)
+                for details in client.fetch_details_many(mailbox_id, ids, max_workers=workers):
                     if isinstance(details, dict):
                         details.setdefault("folder", folder)
                         page_items.append(details)
@@ -30,11 +30,13 @@ DEFAULT_PREPROCESS_VERSION = settings.DEFAULT_PREPROCESS_VERSION
 DEFAULT_LANG = settings.DEFAULT_PREPROCESS_LOCALE
 MAX_CHARS_THREAD_DEFAULT = int(settings.MAX_CHARS_THREAD)
 OPENAI_API_KEY = settings.OPENAI_API_KEY
+# czy ModelPrediction ma FK do słownika – sprawdzane raz przy imporcie, nie w pętli po etykietach
+_HAS_DICT_FK = hasattr(ModelPrediction, "dictionary_id")
 
 # ======================= HELPERY =======================
 
 def _sha256(text: str) -> str:
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha256(text.encode("utf-8"), usedforsecurity=False).hexdigest()
 
 
 def _find_dictionary(code: Optional[str], version: Optional[str], locale: Optional[str]) -> Optional[Dictionary]:
@@ -144,7 +146,7 @@ def _needs_prediction(sample: DatasetSample,
         model_name=OPENAI_MODEL_NAME,
         model_version=OPENAI_MODEL_VERSION,
     )
-    if hasattr(ModelPrediction, "dictionary_id") and dictionary is not None:
+    if _HAS_DICT_FK and dictionary is not None:
         qs = qs.filter(dictionary=dictionary)
     have = set(qs.values_list("kind_id", flat=True))
     return [kid for kid in kinds_by_id.keys() if kid not in have]
@@ -175,12 +177,22 @@ def _upsert_missing_preds(*,
         dictionary_code=dictionary_code,
         dictionary_version=dictionary_version,
         dictionary_locale=dictionary_locale,
+        kind_codes=[kinds_by_id[kid].code for kid in need_kind_ids],
     )
     rows = to_label_rows(raw_args, enums)  # [{"kind_id","value_id","snippet","proba"?}...]
     dictionary_id = enums.get("dictionary_id")
     values_map = _build_values_map(kinds_qs, dictionary_id)
     need_set = set(need_kind_ids)
 
+    # wspólna część klucza predykcji – per wiersz dochodzi tylko kind_id
+    base_kwargs = dict(
+        sample=sample,
+        model_name=OPENAI_MODEL_NAME,
+        model_version=OPENAI_MODEL_VERSION,
+    )
+    if _HAS_DICT_FK and dictionary_id:
+        base_kwargs["dictionary_id"] = dictionary_id
+
     saved = 0
     for r in rows:
         r_kind_id = r.get("kind_id")
@@ -199,16 +211,7 @@ def _upsert_missing_preds(*,
             "proba": float(r.get("proba", 0.0)) if r.get("proba") is not None else 0.0,
             "evidence_snippet": (r.get("snippet") or "").strip(),
         }
-        pred_kwargs = dict(
-            sample=sample,
-            kind_id=r_kind_id,
-            model_name=OPENAI_MODEL_NAME,
-            model_version=OPENAI_MODEL_VERSION,
-        )
-        if hasattr(ModelPrediction, "dictionary_id") and dictionary_id:
-            pred_kwargs["dictionary_id"] = dictionary_id
-
-        ModelPrediction.objects.update_or_create(**pred_kwargs, defaults=defaults)
+        ModelPrediction.objects.update_or_create(**base_kwargs, kind_id=r_kind_id, defaults=defaults)
         saved += 1
 
     return saved, saved > 0
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-15 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0003_thread_useless_thread_user_processed'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='emailmessage',
+            options={'ordering': ['received_at'], 'verbose_name': 'Wiadomość e-mail', 'verbose_name_plural': 'Wiadomości e-mail'},
+        ),
+        migrations.AddIndex(
+            model_name='emailmessage',
+            index=models.Index(fields=['thread', 'sent_at'], name='em_thread_sent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailmessage',
+            index=models.Index(fields=['direction', 'sent_at'], name='em_direction_sent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emailmessage',
+            index=models.Index(condition=models.Q(('useless', False)), fields=['received_at', 'sent_at', 'id'], name='em_useful_order_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-15 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0004_emailmessage_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailmessage',
+            index=models.Index(fields=['thread', '-received_at'], name='em_thread_received_idx'),
+        ),
+    ]
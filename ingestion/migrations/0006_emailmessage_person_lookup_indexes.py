@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-15 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0005_emailmessage_thread_received_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emailmessage',
+            index=models.Index(condition=models.Q(('thread__isnull', False)), fields=['message_id_header'], name='em_mid_with_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['domain'], name='person_domain_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-15 10:17
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+
+PREVIEWS = {
+    "text_plain": "preview_plain",
+    "text_html_parsed": "preview_html_parsed",
+    "text_processed": "preview_processed",
+}
+
+
+def fill_previews(apps, schema_editor):
+    # podglądy dla istniejących wiadomości (jak _preview w modelu)
+    EmailMessage = apps.get_model("ingestion", "EmailMessage")
+    batch = []
+    for msg in EmailMessage.objects.only("id", *PREVIEWS).iterator(chunk_size=1000):
+        for source, target in PREVIEWS.items():
+            text = getattr(msg, source)
+            setattr(msg, target, Truncator(strip_tags(text)).chars(300) if text else "")
+        batch.append(msg)
+        if len(batch) >= 1000:
+            EmailMessage.objects.bulk_update(batch, list(PREVIEWS.values()))
+            batch = []
+    if batch:
+        EmailMessage.objects.bulk_update(batch, list(PREVIEWS.values()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0006_emailmessage_person_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='preview_html_parsed',
+            field=models.CharField(blank=True, default='', editable=False, max_length=300, verbose_name='podgląd (html→tekst)'),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='preview_plain',
+            field=models.CharField(blank=True, default='', editable=False, max_length=300, verbose_name='podgląd (plain)'),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='preview_processed',
+            field=models.CharField(blank=True, default='', editable=False, max_length=300, verbose_name='podgląd (przygotowany tekst)'),
+        ),
+        migrations.RunPython(fill_previews, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
+from django.core.cache import cache
 from django.db import models
 from django.db.models import UniqueConstraint
 from django.db.models.functions import Lower
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
 
 
 class Person(models.Model):
@@ -28,10 +31,31 @@ class Person(models.Model):
         constraints = [
             UniqueConstraint(Lower("email"), name="unique_lower_email")
         ]
+        indexes = [
+            # filtr domeny w adminie (równość) i lista domen (DISTINCT) bez skanu tabeli
+            models.Index(fields=["domain"], name="person_domain_idx"),
+        ]
 
     def __str__(self) -> str:
         return self.display_name or self.email
 
+    DOMAINS_CACHE_KEY = "person:domains"
+    DOMAINS_CACHE_TIMEOUT = 600  # s
+
+    @classmethod
+    def distinct_domains(cls) -> list[str]:
+        """
+        Lista domen osób (filtr admina) – wynik w cache zamiast DISTINCT po całej tabeli przy
+        każdym wyświetleniu listy. Osoba z nową domeną czyści wpis (sygnał post_save w signals.py).
+        """
+        return cache.get_or_set(
+            cls.DOMAINS_CACHE_KEY,
+            lambda: list(
+                cls.objects.exclude(domain="").order_by("domain").values_list("domain", flat=True).distinct()
+            ),
+            cls.DOMAINS_CACHE_TIMEOUT,
+        )
+
 
 class Thread(models.Model):
     """Logiczna grupa wiadomości powiązanych (wątek)."""
@@ -68,6 +92,16 @@ class Thread(models.Model):
         return self.subject_norm or self.thread_key
 
 
+PREVIEW_LENGTH = 300  # znaków w podglądach treści (admin)
+
+
+def _preview(text: str | None) -> str:
+    """Podgląd treści: bez znaczników HTML, skrócony do PREVIEW_LENGTH znaków."""
+    if not text:
+        return ""
+    return Truncator(strip_tags(text)).chars(PREVIEW_LENGTH)
+
+
 class EmailMessage(models.Model):
     """Pojedyncza wiadomość e-mail (bez załączników) z treścią tekstową i HTML."""
     class Direction(models.TextChoices):
@@ -183,6 +217,20 @@ class EmailMessage(models.Model):
         verbose_name="Sformatowany tekst",
     )
 
+    # podglądy liczone przy zapisie treści (save) – widok w adminie nie parsuje całych treści
+    preview_plain = models.CharField(
+        max_length=PREVIEW_LENGTH, blank=True, default="", editable=False,
+        verbose_name="podgląd (plain)",
+    )
+    preview_html_parsed = models.CharField(
+        max_length=PREVIEW_LENGTH, blank=True, default="", editable=False,
+        verbose_name="podgląd (html→tekst)",
+    )
+    preview_processed = models.CharField(
+        max_length=PREVIEW_LENGTH, blank=True, default="", editable=False,
+        verbose_name="podgląd (przygotowany tekst)",
+    )
+
     is_unread = models.BooleanField(
         null=True, blank=True,
         verbose_name="nieprzeczytane",
@@ -207,6 +255,47 @@ class EmailMessage(models.Model):
         verbose_name = "Wiadomość e-mail"
         verbose_name_plural = "Wiadomości e-mail"
         ordering = ["received_at"]
+        indexes = [
+            # rodzice wątku po Message-ID (assign_threads: In-Reply-To/References) – szukamy tylko
+            # wiadomości z już przypisanym wątkiem, więc indeks częściowy
+            models.Index(
+                fields=["message_id_header"],
+                condition=models.Q(thread__isnull=False),
+                name="em_mid_with_thread_idx",
+            ),
+            # wiadomości wątku w kolejności czasu (podgląd/etykietowanie wątku)
+            models.Index(fields=["thread", "sent_at"], name="em_thread_sent_idx"),
+            # last_activity wątku: MAX(received_at) per thread (MAX(sent_at) obsługuje indeks powyżej)
+            models.Index(fields=["thread", "-received_at"], name="em_thread_received_idx"),
+            # filtr ?direction= z sortowaniem po czasie
+            models.Index(fields=["direction", "sent_at"], name="em_direction_sent_idx"),
+            # lista /api/messages z with_useless=false – częściowy indeks zgodny z order_by listy
+            models.Index(
+                fields=["received_at", "sent_at", "id"],
+                condition=models.Q(useless=False),
+                name="em_useful_order_idx",
+            ),
+        ]
+
+    # pole treści -> pole z jego podglądem
+    PREVIEW_FIELDS = {
+        "text_plain": "preview_plain",
+        "text_html_parsed": "preview_html_parsed",
+        "text_processed": "preview_processed",
+    }
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        deferred = self.get_deferred_fields()
+        previews = []
+        for source, target in self.PREVIEW_FIELDS.items():
+            # podgląd przeliczamy tylko, gdy zapisujemy jego treść
+            if source in update_fields if update_fields is not None else source not in deferred:
+                setattr(self, target, _preview(getattr(self, source)))
+                previews.append(target)
+        if update_fields is not None and previews:
+            kwargs["update_fields"] = {*update_fields, *previews}
+        super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         return self.subject or "(brak tematu)"
@@ -263,4 +352,40 @@ class PartnerStat(models.Model):
 
     def __str__(self):
         return f"{self.a_id} ↔ {self.b_id}  (msgs={self.msg_count}, processed={self.msg_processed_count})"
+
+    PAIR_CACHE_TIMEOUT = 300  # s
+    # pary potwierdzone w tym procesie (bez odpytywania cache/bazy); limit chroni pamięć workera
+    PAIR_SET_MAX = 100_000
+    _known_pairs: set = set()
+
+    @staticmethod
+    def pair_cache_key(a_id: int, b_id: int) -> str:
+        return f"ps_pair:{a_id}:{b_id}"
+
+    @classmethod
+    def remember_pair(cls, a_id: int, b_id: int) -> None:
+        if len(cls._known_pairs) < cls.PAIR_SET_MAX:
+            cls._known_pairs.add((a_id, b_id))
+
+    @classmethod
+    def pair_exists(cls, x: int, y: int) -> bool:
+        """
+        Czy para (x, y) ma wiersz PartnerStat.
+        Najpierw zbiór par znanych w procesie, potem wynik w cache (get_or_set).
+        Nowa para czyści wpis (sygnał post_save w signals.py); usunięcie pary nie musi:
+        nieaktualne True tylko pomija skrót "brak pary", a filtr wiadomości i tak zwróci pusty wynik.
+        Z tego samego powodu w pamięci procesu trzymamy wyłącznie odpowiedzi True – odpowiedź
+        "brak pary" mogłaby być nieaktualna względem innych workerów.
+        """
+        a_id, b_id = (x, y) if x < y else (y, x)
+        if (a_id, b_id) in cls._known_pairs:
+            return True
+        exists = cache.get_or_set(
+            cls.pair_cache_key(a_id, b_id),
+            lambda: cls.objects.filter(a_id=a_id, b_id=b_id).exists(),
+            cls.PAIR_CACHE_TIMEOUT,
+        )
+        if exists:
+            cls.remember_pair(a_id, b_id)
+        return exists
     
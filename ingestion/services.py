@@ -4,6 +4,7 @@ from django.utils import timezone
 import base64
 import binascii
 import re
+from itertools import islice
 from typing import Iterable, Mapping, Optional
 from datetime import timezone as tz, timedelta, datetime
 from email.utils import parsedate_to_datetime
@@ -12,7 +13,7 @@ import html as html_lib
 from textwrap import fill
 from bs4 import BeautifulSoup, NavigableString, Tag
 
-from .models import EmailMessage, Person, MessageRecipient
+from .models import EmailMessage, Person, MessageRecipient, Thread
 
 
 # --- Reguły / stałe ----------------------------------------------------------
@@ -271,6 +272,66 @@ def import_external_messages(items: Iterable[Mapping]) -> dict:
 
     return {"created": created, "skipped": skipped}
 
+# --- Wątki z podpowiedzi ------------------------------------------------------
+
+def assign_threads_from_hints(messages, *, batch_size: int = 1000) -> dict:
+    """
+    Przypisuje wiadomościom wątki według thread_hint: tworzy brakujące Thread(thread_key=hint)
+    z subject_norm z pierwszej wiadomości o danej podpowiedzi i ustawia EmailMessage.thread.
+
+    `messages` – queryset EmailMessage; przetwarzany paczkami po `batch_size` (każda we własnej
+    transakcji), więc pamięć i czas blokad nie rosną z liczbą wiadomości.
+    Zwraca {"created": nowe wątki, "updated": zmienione przypisania}.
+    """
+    created = 0
+    updated = 0
+    rows = (
+        messages.select_related(None)
+        .only("id", "thread_id", "thread_hint", "subject")
+        .iterator(chunk_size=batch_size)
+    )
+    while batch := list(islice(rows, batch_size)):
+        # temat nowego wątku – z pierwszej wiadomości z daną podpowiedzią
+        subject_by_hint = {}
+        msgs = []
+        for msg in batch:
+            hint = (msg.thread_hint or "").strip()
+            if hint:
+                subject_by_hint.setdefault(hint, (msg.subject or "").strip())
+                msgs.append((msg, hint))
+        if not msgs:
+            continue
+
+        with transaction.atomic():
+            # wątki hurtem: brakujące jednym INSERT-em, potem jedna mapa thread_key -> id
+            existing = set(
+                Thread.objects.filter(thread_key__in=subject_by_hint).values_list("thread_key", flat=True)
+            )
+            Thread.objects.bulk_create(
+                [
+                    Thread(thread_key=hint, subject_norm=subject)
+                    for hint, subject in subject_by_hint.items()
+                    if hint not in existing
+                ],
+                ignore_conflicts=True,
+            )
+            created += len(subject_by_hint) - len(existing)
+            id_map = dict(
+                Thread.objects.filter(thread_key__in=subject_by_hint).values_list("thread_key", "id")
+            )
+
+            changed = []
+            for msg, hint in msgs:
+                if msg.thread_id != id_map[hint]:
+                    msg.thread_id = id_map[hint]
+                    changed.append(msg)
+            # zmiana wątku nie wpływa na PartnerStat, więc pominięcie sygnałów save jest bezpieczne
+            EmailMessage.objects.bulk_update(changed, ["thread"], batch_size=500)
+            updated += len(changed)
+
+    return {"created": created, "updated": updated}
+
+
 # ----------- Html to string -----------------------------------------
 
 def html_to_text(html_input: str, *, max_width: int | None = 0) -> str:
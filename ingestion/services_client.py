@@ -1,7 +1,10 @@
 import base64
 import hashlib
 import requests
-from typing import Dict, Generator, Mapping, Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from requests.adapters import HTTPAdapter
+from typing import Dict, Generator, Iterable, Mapping, Optional, List
 import time
 
 class TasklyticsClient:
@@ -14,20 +17,29 @@ class TasklyticsClient:
         self.base_url = base_url.rstrip("/")
         self.login = login
         self.password = password
-        self.session = session or requests.Session()
+        self.session = session or self._default_session()
         self.token: Optional[str] = None
 
+    @staticmethod
+    def _default_session() -> requests.Session:
+        # keep-alive: jedno połączenie TLS na wiele wywołań; pula mieści równoległe fetch_details_many
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        return session
+
     # ------------------------------
     # Auth
     # ------------------------------
+    @cached_property
     def _user_key(self) -> str:
+        # liczony raz – ponowne logowanie (401) korzysta z tej samej wartości
         sha = hashlib.sha256(self.password.encode("utf-8")).hexdigest()
         return base64.b64encode(f"{self.login}:{sha}".encode("utf-8")).decode("utf-8")
 
     def authenticate(self) -> str:
         url = f"{self.base_url}/app/legacy/login/v3?scope=PRODUCTION"
         headers = {"Content-Type": "application/json", "Accept": "application/json"}
-        resp = self.session.post(url, headers=headers, data=self._user_key(), timeout=30)
+        resp = self.session.post(url, headers=headers, data=self._user_key, timeout=30)
         resp.raise_for_status()
         data = resp.json()
         self.token = data[0]["cloudToken"]
@@ -114,6 +126,19 @@ class TasklyticsClient:
         resp = self._get(url, params=params)
         return resp.json()
 
+    def fetch_details_many(self, mailbox_id: int, message_ids: Iterable[str], *, max_workers: int = 8) -> List[Mapping]:
+        """
+        Szczegóły wielu wiadomości – zapytania równolegle (wątki; czas to oczekiwanie na sieć),
+        wynik w kolejności message_ids.
+        """
+        message_ids = list(message_ids)
+        if max_workers <= 1 or len(message_ids) <= 1:
+            return [self.fetch_details(mailbox_id, mid) for mid in message_ids]
+        if not self.token:
+            self.authenticate()  # raz, zanim wątki zaczną równolegle pytać o token
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(message_ids))) as pool:
+            return list(pool.map(lambda mid: self.fetch_details(mailbox_id, mid), message_ids))
+
     def iter_details_for_folder(self, mailbox_id: int, folder: str, *, message_per_page: int = 100, page_from: int = 1, page_to: int = 1):
         for msg_id in self.iter_message_ids(mailbox_id, folder, message_per_page=message_per_page, page_from=page_from, page_to=page_to):
             details = self.fetch_details(mailbox_id, msg_id)
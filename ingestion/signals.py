@@ -1,11 +1,12 @@
 # ingestion/signals.py
 from typing import Iterable, Tuple, Set
 from django.db.models import Q, Exists, OuterRef, Count, Max
+from django.core.cache import cache
 from django.db.models.signals import post_save, post_delete, pre_save
 from django.db.models.functions import Coalesce
 from django.dispatch import receiver
 
-from .models import EmailMessage, MessageRecipient, PartnerStat
+from .models import EmailMessage, MessageRecipient, PartnerStat, Person
 
 # ---- helpers ---------------------------------------------------------------
 
@@ -97,6 +98,15 @@ def recompute_partner_stats_for_pairs(pairs: Iterable[Tuple[int, int]]) -> None:
             last_message_at=agg["last_message_at"],
         )
 
+def recompute_partner_stats_for_message(msg: EmailMessage) -> None:
+    """
+    Przelicz PartnerStat dla par wiadomości – dla zmian flag (useless/user_processed) robionych
+    przez QuerySet.update(), który nie wysyła sygnałów save. Wystarczą id/from_person_id/delivered_to_id.
+    """
+    pairs = _message_pairs(msg)
+    if pairs:
+        recompute_partner_stats_for_pairs(pairs)
+
 @receiver(pre_save, sender=EmailMessage)
 def email_pre_save_capture_pairs(sender, instance: EmailMessage, **kwargs):
     """
@@ -157,4 +167,22 @@ def mr_post_delete_recompute(sender, instance: MessageRecipient, **kwargs):
     msg = instance.message
     pairs = _message_pairs(msg)
     if pairs:
-        recompute_partner_stats_for_pairs(pairs)
\ No newline at end of file
+        recompute_partner_stats_for_pairs(pairs)
+
+
+# ---- PartnerStat: cache istnienia pary --------------------------------------
+@receiver(post_save, sender=PartnerStat)
+def partner_stat_post_save_cache(sender, instance: PartnerStat, created, **kwargs):
+    # nowa para -> wcześniej zapamiętane "brak pary" jest nieaktualne
+    if created:
+        cache.delete(PartnerStat.pair_cache_key(instance.a_id, instance.b_id))
+        PartnerStat.remember_pair(instance.a_id, instance.b_id)
+
+
+# ---- Person: cache listy domen (filtr admina) --------------------------------
+@receiver(post_save, sender=Person)
+def person_domains_cache(sender, instance: Person, **kwargs):
+    # nowa domena -> lista w cache jest niepełna
+    domains = cache.get(Person.DOMAINS_CACHE_KEY)
+    if domains is not None and instance.domain and instance.domain not in domains:
+        cache.delete(Person.DOMAINS_CACHE_KEY)